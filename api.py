@@ -0,0 +1,219 @@
+import json
+
+from flask import Blueprint, current_app, request
+
+import changefeed
+import textstore
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_IDS = 500
+SYNC_LIMIT = 1000
+MAX_SYNC_LIMIT = 10000
+
+# Exposed fields per resource, mapped to their SQL expressions
+RESOURCES = {
+    'chemicals': {
+        # Text joins go unused, and SQLite skips them, unless their fields are requested
+        'from': f"chemicals c {textstore.text_join('warnings', 'c')} {textstore.text_join('description', 'c')}",
+        'key': 'c.id',
+        'fields': {
+            'id': 'c.id',
+            'name': 'c.name',
+            'mix_rate': 'c.mix_rate',
+            'mix_qty': 'c.mix_qty',
+            'mix_unit': 'c.mix_unit',
+            'warnings': textstore.joined('warnings', 'c'),
+            'description': textstore.joined('description', 'c'),
+            'smiles': 'c.smiles',
+        },
+    },
+    'trucks': {
+        'from': 'trucks tr',
+        'key': 'tr.id',
+        'fields': {
+            'id': 'tr.id',
+            'truck_name': 'tr.truck_name',
+            'license_plate': 'tr.license_plate',
+            'description': 'tr.description',
+        },
+    },
+    'tanks': {
+        # Same join as the tanks page
+        'from': 'tanks t LEFT JOIN trucks tr ON t.truck_id = tr.id',
+        'key': 't.id',
+        'fields': {
+            'id': 't.id',
+            'tank_name': 't.tank_name',
+            'capacity': 't.capacity',
+            'location': 't.location',
+            'truck_id': 't.truck_id',
+            'truck_name': 'tr.truck_name',
+            'current_level': 't.current_level',
+            'low_level_threshold': 't.low_level_threshold',
+        },
+    },
+    'usage_logs': {
+        'from': f"usage_log u {textstore.text_join('notes', 'u')}",
+        'key': 'u.id',
+        'fields': {
+            'id': 'u.id',
+            'chemical_name': 'u.chemical_name',
+            'tank_name': 'u.tank_name',
+            'amount_used': 'u.amount_used',
+            'date_logged': 'u.date_logged',
+            'notes': textstore.joined('notes', 'u'),
+        },
+    },
+}
+
+
+class ApiError(Exception):
+    """A client error reported as a JSON body with an HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_response(payload, status=200):
+    """Serialize compactly; row tuples become JSON arrays without per-row dicts."""
+    body = json.dumps(payload, separators=(',', ':'))
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def _projection(resource):
+    """Resolve ?fields= into field names, always leading with id."""
+    fields = RESOURCES[resource]['fields']
+    requested = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    if not requested:
+        return list(fields)
+    unknown = [name for name in requested if name not in fields]
+    if unknown:
+        raise ApiError(f"Unknown field(s) for {resource}: {', '.join(unknown)}")
+    # The id comes first so clients can page with ?after= and match batch results
+    return ['id'] + [name for name in dict.fromkeys(requested) if name != 'id']
+
+
+def _int_list(text, name):
+    """Parse a comma-separated list of integers from a query parameter."""
+    try:
+        return [int(value) for value in text.split(',') if value.strip()]
+    except ValueError as e:
+        raise ApiError(f"'{name}' must be a comma-separated list of integers") from e
+
+
+def query_resource(conn, resource, field_names, ids=None, after=None, limit=DEFAULT_LIMIT):
+    """Run a projected, keyset-paginated or batched query and return (rows, next_after)."""
+    spec = RESOURCES[resource]
+    columns = ', '.join(spec['fields'][name] for name in field_names)
+    sql = f"SELECT {columns} FROM {spec['from']}"
+    params = []
+
+    if ids is not None:
+        sql += f" WHERE {spec['key']} IN ({','.join('?' * len(ids))})"
+        params.extend(ids)
+    elif after is not None:
+        sql += f" WHERE {spec['key']} > ?"
+        params.append(after)
+    sql += f" ORDER BY {spec['key']}"
+    if ids is None:
+        # Fetch one extra row to learn whether there is a next page
+        sql += ' LIMIT ?'
+        params.append(limit + 1)
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(sql, params).fetchall()
+
+    next_after = None
+    if ids is None and len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1][0]
+    return rows, next_after
+
+
+def create_api_blueprint(get_connection):
+    """Build the versioned JSON API over a connection factory."""
+    api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+    @api.errorhandler(ApiError)
+    def handle_api_error(error):
+        return _json_response({'error': str(error)}, error.status)
+
+    @api.route('/<resource>')
+    def list_resource(resource):
+        """List a resource with ?fields=, ?ids= batching or ?after=/&limit= keyset paging."""
+        if resource not in RESOURCES:
+            raise ApiError(f"Unknown resource '{resource}'", 404)
+        field_names = _projection(resource)
+
+        ids = None
+        if 'ids' in request.args:
+            ids = _int_list(request.args['ids'], 'ids')
+            if not ids or len(ids) > MAX_IDS:
+                raise ApiError(f"'ids' must list between 1 and {MAX_IDS} ids")
+        after = request.args.get('after', type=int)
+        limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+        if not 1 <= limit <= MAX_LIMIT:
+            raise ApiError(f"'limit' must be between 1 and {MAX_LIMIT}")
+
+        conn = get_connection()
+        try:
+            rows, next_after = query_resource(conn, resource, field_names, ids, after, limit)
+        finally:
+            conn.close()
+        return _json_response({'fields': field_names, 'rows': rows, 'next_after': next_after})
+
+    @api.route('/<resource>/<int:item_id>')
+    def get_resource(resource, item_id):
+        """Fetch one item by id as a field -> value object."""
+        if resource not in RESOURCES:
+            raise ApiError(f"Unknown resource '{resource}'", 404)
+        field_names = _projection(resource)
+
+        conn = get_connection()
+        try:
+            rows, _ = query_resource(conn, resource, field_names, ids=[item_id])
+        finally:
+            conn.close()
+        if not rows:
+            raise ApiError(f"{resource} {item_id} not found", 404)
+        return _json_response(dict(zip(field_names, rows[0], strict=True)))
+
+    @api.route('/sync')
+    def sync_changes():
+        """Return the rows changed since ?since=<seq>, for offline tablets.
+
+        A reset response means the client is new or older than the compacted
+        history: it should download the lists, then sync from last_seq.
+        """
+        since = request.args.get('since', type=int)
+        limit = request.args.get('limit', SYNC_LIMIT, type=int)
+        if not 1 <= limit <= MAX_SYNC_LIMIT:
+            raise ApiError(f"'limit' must be between 1 and {MAX_SYNC_LIMIT}")
+
+        conn = get_connection()
+        try:
+            changes = changefeed.read_changes(conn, since, limit)
+            if changes is None:
+                return _json_response({'reset': True, 'last_seq': changefeed.latest_seq(conn)})
+            upserts, deletes, last_seq, more = changes
+
+            tables = {}
+            for table, resource in changefeed.TRACKED_TABLES.items():
+                field_names = list(RESOURCES[resource]['fields'])
+                rows = []
+                for start in range(0, len(upserts[table]), MAX_IDS):
+                    batch, _ = query_resource(conn, resource, field_names, ids=upserts[table][start:start + MAX_IDS])
+                    rows.extend(batch)
+                # Rows deleted again after this page of changes are reported as deletes
+                found = {row[0] for row in rows}
+                removed = deletes[table] + [row_id for row_id in upserts[table] if row_id not in found]
+                if rows or removed:
+                    tables[resource] = {'fields': field_names, 'upserts': rows, 'deletes': removed}
+        finally:
+            conn.close()
+        return _json_response({'reset': False, 'last_seq': last_seq, 'more': more, 'changes': tables})
+
+    return api
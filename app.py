@@ -1,81 +1,51 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, make_response
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, send_file, make_response, jsonify
 import sqlite3
 from datetime import datetime
 import os
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
 import io
+import api
+import compliance
+import inventory
+import mixrate
+import refcache
+import replica
+import reports
+import retention
+import rowstream
+import scheduler
+import schema
+import sqlprofile
+import textstore
+import workers
 
 app = Flask(__name__)
-app.secret_key = 'your-secret-key-here'  # Change this in production
-DB_NAME = "AECD.db"
+app.secret_key = os.environ.get('NUTTALLX_SECRET_KEY', 'your-secret-key-here')  # Change this in production
+DB_NAME = os.environ.get('NUTTALLX_DB', "AECD.db")
 
 def get_db_connection():
-    """Get database connection and ensure all tables exist."""
-    conn = sqlite3.connect(DB_NAME)
+    """Get database connection, upgrading the schema first if it is out of date."""
+    conn = sqlprofile.connect(DB_NAME)
     conn.row_factory = sqlite3.Row
+    schema.ensure_schema(conn)
+    return conn
 
-    # Create tables if they don't exist
-    cursor = conn.cursor()
-
-    # Ensure chemicals table exists (should already exist from main.py)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chemicals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            mix_rate TEXT,
-            warnings TEXT,
-            description TEXT
-        )
-    ''')
-
-    # Create trucks table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS trucks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            truck_name TEXT NOT NULL UNIQUE,
-            license_plate TEXT,
-            description TEXT
-        )
-    ''')
+app.register_blueprint(api.create_api_blueprint(get_db_connection))
 
-    # Create tanks table (modified to include truck_id)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tanks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tank_name TEXT NOT NULL UNIQUE,
-            capacity INTEGER,
-            location TEXT,
-            truck_id INTEGER,
-            FOREIGN KEY (truck_id) REFERENCES trucks (id)
-        )
-    ''')
-    
-    # Add truck_id column if it doesn't exist (for existing databases)
+def render_rows(conn, template, **context):
+    """Render a template that iterates row streams, closing the connection once the page is sent."""
     try:
-        cursor.execute('ALTER TABLE tanks ADD COLUMN truck_id INTEGER')
-        conn.commit()
-    except sqlite3.OperationalError:
-        # Column already exists, ignore the error
-        pass
-
-    # Create usage_log table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS usage_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            chemical_name TEXT NOT NULL,
-            tank_name TEXT NOT NULL,
-            amount_used REAL NOT NULL,
-            date_logged TEXT NOT NULL,
-            notes TEXT
-        )
-    ''')
+        response = app.response_class(stream_template(template, **context))
+    except Exception:
+        # No response will be closed to release it, e.g. when the template fails to load
+        conn.close()
+        raise
+    response.call_on_close(conn.close)
+    return response
 
-    conn.commit()
-    return conn
+@app.before_request
+def start_background_jobs():
+    """Start the report and retention scheduler on the first request."""
+    scheduler.start(DB_NAME)
 
 @app.route('/')
 def index():
@@ -92,6 +62,7 @@ def index():
         ORDER BY date_logged DESC 
         LIMIT 5
     ''').fetchall()
+    low_level_tanks = inventory.low_level_tanks(conn)
 
     conn.close()
 
@@ -99,15 +70,20 @@ def index():
                          chemical_count=chemical_count,
                          tank_count=tank_count,
                          truck_count=truck_count,
-                         recent_logs=recent_logs)
+                         recent_logs=recent_logs,
+                         low_level_tanks=low_level_tanks)
 
 @app.route('/chemicals')
 def view_chemicals():
-    """List all chemicals."""
+    """List all chemicals with their cached molecular properties."""
     conn = get_db_connection()
-    chemicals = conn.execute('SELECT * FROM chemicals ORDER BY name').fetchall()
-    conn.close()
-    return render_template('view_chemicals.html', chemicals=chemicals)
+    chemicals = rowstream.stream(conn, f'''
+        SELECT {reports.CHEMICAL_COLUMNS}, d.mol_weight, d.logp, d.hazard_flags
+        FROM chemicals c {reports.CHEMICAL_TEXT_JOINS}
+        LEFT JOIN chemical_descriptors d ON d.canonical_smiles = c.smiles
+        ORDER BY c.name
+    ''')
+    return render_rows(conn, 'view_chemicals.html', chemicals=chemicals)
 
 @app.route('/trucks')
 def view_trucks():
@@ -209,14 +185,14 @@ def delete_truck(truck_id):
 def view_tanks():
     """List all tanks with their assigned trucks."""
     conn = get_db_connection()
-    tanks = conn.execute('''
+    low_level_tanks = inventory.low_level_tanks(conn)
+    tanks = rowstream.stream(conn, '''
         SELECT t.*, tr.truck_name 
         FROM tanks t 
         LEFT JOIN trucks tr ON t.truck_id = tr.id 
         ORDER BY t.tank_name
-    ''').fetchall()
-    conn.close()
-    return render_template('view_tanks.html', tanks=tanks)
+    ''')
+    return render_rows(conn, 'view_tanks.html', tanks=tanks, low_level_tanks=low_level_tanks)
 
 @app.route('/tanks/add', methods=['GET', 'POST'])
 def add_tank():
@@ -301,6 +277,7 @@ def delete_tank(tank_id):
             if logs_using_tank > 0:
                 flash(f'Cannot delete tank "{tank["tank_name"]}" because it has {logs_using_tank} usage log(s). Delete the logs first.', 'error')
             else:
+                conn.execute('DELETE FROM tank_events WHERE tank_id = ?', (tank_id,))
                 conn.execute('DELETE FROM tanks WHERE id = ?', (tank_id,))
                 conn.commit()
                 flash(f'Tank "{tank["tank_name"]}" deleted successfully!', 'success')
@@ -311,6 +288,24 @@ def delete_tank(tank_id):
     
     return redirect(url_for('view_tanks'))
 
+@app.route('/tanks/fill/<int:tank_id>', methods=['POST'])
+def fill_tank(tank_id):
+    """Fill a tank to capacity, or refill it by the amount entered."""
+    amount = request.form.get('amount', type=float)
+    notes = request.form.get('notes', '')
+    conn = get_db_connection()
+
+    try:
+        inventory.record_fill(conn, tank_id, amount, notes)
+        conn.commit()
+        flash('Tank level updated successfully!', 'success')
+    except ValueError as e:
+        flash(f'Error filling tank: {str(e)}', 'error')
+    finally:
+        conn.close()
+
+    return redirect(url_for('view_tanks'))
+
 @app.route('/log', methods=['GET', 'POST'])
 def log_usage():
     """Log chemical usage."""
@@ -323,13 +318,22 @@ def log_usage():
         notes = request.form.get('notes', '')
         date_logged = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        if chemical_names and tank_name and amount_used is not None:
+        ref = refcache.reference_data(conn, DB_NAME)
+        unknown = [name for name in chemical_names if name not in ref.chemical_ids]
+        if tank_name and tank_name not in ref.tank_ids:
+            unknown.append(tank_name)
+
+        if unknown:
+            flash(f'Unknown chemical or tank: {", ".join(unknown)}', 'error')
+        elif chemical_names and tank_name and amount_used is not None:
             # Combine all selected chemicals into one entry
             combined_chemicals = ', '.join(chemical_names)
-            conn.execute('''
-                INSERT INTO usage_log (chemical_name, tank_name, amount_used, date_logged, notes)
+            cursor = conn.execute('''
+                INSERT INTO usage_log (chemical_name, tank_name, amount_used, date_logged, notes_id)
                 VALUES (?, ?, ?, ?, ?)
-            ''', (combined_chemicals, tank_name, amount_used, date_logged, notes))
+            ''', (combined_chemicals, tank_name, amount_used, date_logged, textstore.intern(conn, notes)))
+            # Draw down the tank level in the same transaction as the log entry
+            inventory.record_usage(conn, cursor.lastrowid, tank_name, amount_used, date_logged)
             conn.commit()
             flash(f'Usage logged successfully for {len(chemical_names)} chemical(s) in one entry!', 'success')
             conn.close()
@@ -337,23 +341,32 @@ def log_usage():
         else:
             flash('All fields except notes are required!', 'error')
 
-    # Get chemicals and tanks for the form
-    chemicals = conn.execute('SELECT name FROM chemicals ORDER BY name').fetchall()
-    tanks = conn.execute('SELECT tank_name FROM tanks ORDER BY tank_name').fetchall()
+    # Get chemicals and tanks for the form from the shared cache
+    ref = refcache.reference_data(conn, DB_NAME)
     conn.close()
 
-    return render_template('log_usage.html', chemicals=chemicals, tanks=tanks)
+    return render_template('log_usage.html', chemicals=ref.chemicals, tanks=ref.tanks)
 
 @app.route('/logs')
 def view_logs():
-    """View all usage logs."""
+    """View all usage logs, or one archived year with ?archive=YYYY."""
+    archive_year = request.args.get('archive', '')
+    archive_years = retention.list_archive_years()
+
+    if archive_year:
+        if archive_year not in archive_years:
+            flash(f'No archived logs found for {archive_year}!', 'error')
+            return redirect(url_for('view_logs'))
+        logs = retention.fetch_archived_logs(archive_year)
+        return render_template('view_logs.html', logs=logs,
+                               archive_year=archive_year, archive_years=archive_years)
+
     conn = get_db_connection()
-    logs = conn.execute('''
-        SELECT * FROM usage_log 
-        ORDER BY date_logged DESC
-    ''').fetchall()
-    conn.close()
-    return render_template('view_logs.html', logs=logs)
+    logs = rowstream.stream(conn, f'''
+        SELECT {reports.LOG_COLUMNS} FROM usage_log u {reports.LOG_TEXT_JOINS}
+        ORDER BY u.date_logged DESC
+    ''')
+    return render_rows(conn, 'view_logs.html', logs=logs, archive_years=archive_years)
 
 @app.route('/logs/delete/<int:log_id>')
 def delete_log(log_id):
@@ -365,8 +378,11 @@ def delete_log(log_id):
         log = conn.execute('SELECT * FROM usage_log WHERE id = ?', (log_id,)).fetchone()
         if not log:
             flash('Usage log not found!', 'error')
+        elif compliance.is_closed(conn, log['date_logged']):
+            flash(f'Usage logs from {log["date_logged"][:7]} are in a closed compliance period and cannot be deleted!', 'error')
         else:
             conn.execute('DELETE FROM usage_log WHERE id = ?', (log_id,))
+            inventory.remove_usage(conn, log_id)
             conn.commit()
             flash('Usage log deleted successfully!', 'success')
     except Exception as e:
@@ -382,18 +398,31 @@ def edit_log(log_id):
     conn = get_db_connection()
 
     if request.method == 'POST':
-        chemical_name = request.form['chemical_name']
+        # The selected chemicals as log_usage takes them, or the entry's stored chemical name
+        chemical_names = request.form.getlist('chemical_names')
+        chemical_name = ', '.join(chemical_names) if chemical_names else request.form['chemical_name']
         tank_name = request.form['tank_name']
         amount_used = request.form.get('amount_used', type=float)
         notes = request.form.get('notes', '')
 
-        if chemical_name and tank_name and amount_used is not None:
+        ref = refcache.reference_data(conn, DB_NAME)
+        if not chemical_names and chemical_name:
+            # A stored combined entry joins its chemicals with ', ', which a single name may contain too
+            chemical_names = [chemical_name] if chemical_name in ref.chemical_ids else chemical_name.split(', ')
+        unknown = [name for name in chemical_names if name not in ref.chemical_ids]
+        if tank_name and tank_name not in ref.tank_ids:
+            unknown.append(tank_name)
+
+        if unknown:
+            flash(f'Unknown chemical or tank: {", ".join(unknown)}', 'error')
+        elif chemical_name and tank_name and amount_used is not None:
             try:
                 conn.execute('''
                     UPDATE usage_log 
-                    SET chemical_name = ?, tank_name = ?, amount_used = ?, notes = ?
+                    SET chemical_name = ?, tank_name = ?, amount_used = ?, notes = NULL, notes_id = ?
                     WHERE id = ?
-                ''', (chemical_name, tank_name, amount_used, notes, log_id))
+                ''', (chemical_name, tank_name, amount_used, textstore.intern(conn, notes), log_id))
+                inventory.revise_usage(conn, log_id, tank_name, amount_used)
                 conn.commit()
                 flash('Usage log updated successfully!', 'success')
                 conn.close()
@@ -404,77 +433,53 @@ def edit_log(log_id):
             flash('All fields except notes are required!', 'error')
 
     # Get log to edit
-    log = conn.execute('SELECT * FROM usage_log WHERE id = ?', (log_id,)).fetchone()
+    log = conn.execute(f'SELECT {reports.LOG_COLUMNS} FROM usage_log u {reports.LOG_TEXT_JOINS} WHERE u.id = ?',
+                       (log_id,)).fetchone()
     if not log:
         flash('Usage log not found!', 'error')
         conn.close()
         return redirect(url_for('view_logs'))
 
-    # Get chemicals and tanks for the form
-    chemicals = conn.execute('SELECT name FROM chemicals ORDER BY name').fetchall()
-    tanks = conn.execute('SELECT tank_name FROM tanks ORDER BY tank_name').fetchall()
+    # Get chemicals and tanks for the form from the shared cache
+    ref = refcache.reference_data(conn, DB_NAME)
     conn.close()
 
-    return render_template('edit_log.html', log=log, chemicals=chemicals, tanks=tanks)
+    return render_template('edit_log.html', log=log, chemicals=ref.chemicals, tanks=ref.tanks)
+
+def read_report_filters():
+    """Read the truck, tank, chemical, start and end report filters from the query string."""
+    return reports.normalize_filters({name: request.args.get(name) for name in reports.FILTER_NAMES})
+
+def report_title(base, filters):
+    """Append the active filters to a report title."""
+    description = reports.describe_filters(filters)
+    return f"{base} ({description})" if description else base
 
 @app.route('/export/chemicals')
 def export_chemicals_pdf():
-    """Export chemicals list as PDF."""
+    """Export chemicals list as PDF, optionally only those used by a truck or tank in a date range."""
+    try:
+        filters = read_report_filters()
+    except ValueError as e:
+        flash(f'Error exporting chemicals: {str(e)}', 'error')
+        return redirect(url_for('view_chemicals'))
+
     conn = get_db_connection()
-    chemicals = conn.execute('SELECT * FROM chemicals ORDER BY name').fetchall()
+    # Serve the overnight copy while nothing it shows has changed
+    cached = None if filters else scheduler.cached_report(conn, 'chemicals')
     conn.close()
-
-    # Create PDF in memory
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, 
-                          rightMargin=30, leftMargin=30, 
-                          topMargin=30, bottomMargin=30)
-
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Title
-    title = Paragraph("NUTtall X - Chemical Inventory Report", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 12))
-
-    # Date
-    date_p = Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])
-    elements.append(date_p)
-    elements.append(Spacer(1, 24))
-
-    if chemicals:
-        # Table data
-        data = [['Name', 'Mix Rate', 'Warnings', 'Description']]
-        for chem in chemicals:
-            data.append([
-                Paragraph(chem['name'], styles['Normal']),
-                Paragraph(chem['mix_rate'] or '-', styles['Normal']),
-                Paragraph(chem['warnings'] or '-', styles['Normal']),
-                Paragraph(chem['description'] or '-', styles['Normal'])
-            ])
-
-        # Create table
-        table = Table(data, colWidths=[1.5*inch, 1.5*inch, 2*inch, 2.5*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
+    if cached:
+        pdf = cached
     else:
-        elements.append(Paragraph("No chemicals found.", styles['Normal']))
-
-    doc.build(elements)
-    buffer.seek(0)
+        # Read from the reporting replica so a long export never holds up /log writes, and
+        # build the PDF in the export pool; the rows stream in, so the connection stays open
+        conn = replica.connect(DB_NAME)
+        title = report_title("NUTtall X - Chemical Inventory Report", filters)
+        pdf = io.BytesIO(workers.run_export(reports.build_chemicals_pdf, reports.fetch_chemicals(conn, filters), title))
+        conn.close()
 
     return send_file(
-        buffer,
+        pdf,
         as_attachment=True,
         download_name=f"chemicals_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
         mimetype='application/pdf'
@@ -482,56 +487,26 @@ def export_chemicals_pdf():
 
 @app.route('/export/tanks')
 def export_tanks_pdf():
-    """Export tanks list as PDF."""
+    """Export tanks list as PDF, optionally for one truck or tank."""
+    try:
+        filters = read_report_filters()
+    except ValueError as e:
+        flash(f'Error exporting tanks: {str(e)}', 'error')
+        return redirect(url_for('view_tanks'))
+
     conn = get_db_connection()
-    tanks = conn.execute('SELECT * FROM tanks ORDER BY tank_name').fetchall()
+    cached = None if filters else scheduler.cached_report(conn, 'tanks')
     conn.close()
-
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter,
-                          rightMargin=30, leftMargin=30,
-                          topMargin=30, bottomMargin=30)
-
-    elements = []
-    styles = getSampleStyleSheet()
-
-    title = Paragraph("NUTtall X - Tank Inventory Report", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 12))
-
-    date_p = Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])
-    elements.append(date_p)
-    elements.append(Spacer(1, 24))
-
-    if tanks:
-        data = [['Tank Name', 'Capacity', 'Location']]
-        for tank in tanks:
-            data.append([
-                tank['tank_name'],
-                str(tank['capacity']) if tank['capacity'] else '-',
-                tank['location'] or '-'
-            ])
-
-        table = Table(data, colWidths=[2*inch, 2*inch, 3*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
+    if cached:
+        pdf = cached
     else:
-        elements.append(Paragraph("No tanks found.", styles['Normal']))
-
-    doc.build(elements)
-    buffer.seek(0)
+        conn = replica.connect(DB_NAME)
+        title = report_title("NUTtall X - Tank Inventory Report", filters)
+        pdf = io.BytesIO(workers.run_export(reports.build_tanks_pdf, reports.fetch_tanks(conn, filters), title))
+        conn.close()
 
     return send_file(
-        buffer,
+        pdf,
         as_attachment=True,
         download_name=f"tanks_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
         mimetype='application/pdf'
@@ -539,66 +514,117 @@ def export_tanks_pdf():
 
 @app.route('/export/logs')
 def export_logs_pdf():
-    """Export usage logs as PDF."""
+    """Export usage logs as PDF, filtered by ?truck=, ?tank=, ?chemical=, ?start= and ?end=."""
+    try:
+        filters = read_report_filters()
+    except ValueError as e:
+        flash(f'Error exporting logs: {str(e)}', 'error')
+        return redirect(url_for('view_logs'))
+
     conn = get_db_connection()
-    logs = conn.execute('''
-        SELECT * FROM usage_log 
-        ORDER BY date_logged DESC
-    ''').fetchall()
+    cached = None if filters else scheduler.cached_report(conn, 'logs')
     conn.close()
-
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter,
-                          rightMargin=30, leftMargin=30,
-                          topMargin=30, bottomMargin=30)
-
-    elements = []
-    styles = getSampleStyleSheet()
-
-    title = Paragraph("NUTtall X - Usage Logs Report", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 12))
-
-    date_p = Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])
-    elements.append(date_p)
-    elements.append(Spacer(1, 24))
-
-    if logs:
-        data = [['Date', 'Chemical', 'Tank', 'Amount', 'Notes']]
-        for log in logs:
-            data.append([
-                Paragraph(log['date_logged'], styles['Normal']),
-                Paragraph(log['chemical_name'], styles['Normal']),
-                Paragraph(log['tank_name'], styles['Normal']),
-                Paragraph(str(log['amount_used']), styles['Normal']),
-                Paragraph(log['notes'] or '-', styles['Normal'])
-            ])
-
-        table = Table(data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch, 1*inch, 2*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(table)
+    if cached:
+        pdf = cached
     else:
-        elements.append(Paragraph("No usage logs found.", styles['Normal']))
-
-    doc.build(elements)
-    buffer.seek(0)
+        conn = replica.connect(DB_NAME)
+        title = report_title("NUTtall X - Usage Logs Report", filters)
+        pdf = io.BytesIO(workers.run_export(reports.build_logs_pdf, reports.fetch_logs(conn, filters), title))
+        conn.close()
 
     return send_file(
-        buffer,
+        pdf,
         as_attachment=True,
         download_name=f"usage_logs_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
         mimetype='application/pdf'
     )
 
+@app.route('/export/compliance')
+def export_compliance_pdf():
+    """Export applied totals per chemical for ?start=YYYY-MM through ?end=YYYY-MM, grouped ?by=month|quarter|year."""
+    now = datetime.now()
+    start = request.args.get('start') or f"{now.year}-01"
+    end = request.args.get('end') or now.strftime('%Y-%m')
+    by = request.args.get('by') or 'month'
+
+    conn = get_db_connection()
+    try:
+        # Closed periods are stored totals, so this stays small enough to read live
+        rows = compliance.summarize(conn, start, end, by)
+    except ValueError as e:
+        flash(f'Error exporting compliance summary: {str(e)}', 'error')
+        return redirect(url_for('view_logs'))
+    finally:
+        conn.close()
+
+    title = f"NUTtall X - Compliance Summary {start} to {end} by {by}"
+    pdf = workers.run_export(reports.build_compliance_pdf, rows, title)
+    return send_file(
+        io.BytesIO(pdf),
+        as_attachment=True,
+        download_name=f"compliance_{start}_{end}_{by}.pdf",
+        mimetype='application/pdf'
+    )
+
+def read_dosage_request(conn):
+    """Read tank mixes from a JSON body, or cross tank_id and chemical query parameters."""
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        if not isinstance(payload, dict):
+            raise ValueError('the body must be a JSON object')
+        if not isinstance(payload.get('mixes', []), list):
+            raise ValueError("'mixes' must be a list")
+        mixes = []
+        for mix in payload.get('mixes', []):
+            if not isinstance(mix, dict) or 'tank_id' not in mix:
+                raise ValueError("each mix must be an object with 'tank_id' and 'chemicals'")
+            chemicals = mix.get('chemicals', [])
+            if not isinstance(chemicals, list) or not all(isinstance(name, str) for name in chemicals):
+                raise ValueError("'chemicals' must be a list of chemical names")
+            mixes.append((int(mix['tank_id']), chemicals))
+        return mixes, bool(payload.get('top_up'))
+
+    tank_ids = request.args.getlist('tank_id', type=int)
+    if not tank_ids:
+        tank_ids = [row[0] for row in conn.execute('SELECT id FROM tanks ORDER BY tank_name').fetchall()]
+    chemical_names = request.args.getlist('chemical')
+    return [(tank_id, chemical_names) for tank_id in tank_ids], request.args.get('top_up') == '1'
+
+@app.route('/api/dosage', methods=['GET', 'POST'])
+def dosage_api():
+    """Compute chemical amounts for a batch of tank mixes."""
+    conn = get_db_connection()
+    try:
+        mixes, top_up = read_dosage_request(conn)
+        plan = mixrate.build_load_plan(conn, mixes, top_up)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid dosage request: {str(e)}'}), 400
+    finally:
+        conn.close()
+    return jsonify(plan)
+
+@app.route('/export/dosage')
+def export_dosage_pdf():
+    """Export a load plan for the selected tanks and chemicals as PDF."""
+    conn = get_db_connection()
+    try:
+        mixes, top_up = read_dosage_request(conn)
+        plan = mixrate.build_load_plan(conn, mixes, top_up)
+    except (KeyError, TypeError, ValueError) as e:
+        flash(f'Error exporting load plan: {str(e)}', 'error')
+        return redirect(url_for('view_tanks'))
+    finally:
+        conn.close()
+
+    pdf = workers.run_export(reports.build_load_plan_pdf, plan)
+
+    return send_file(
+        io.BytesIO(pdf),
+        as_attachment=True,
+        download_name=f"load_plan_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+        mimetype='application/pdf'
+    )
+
 @app.route('/reports')
 def view_reports():
     """View all generated PDF reports in the current directory."""
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import contextlib
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = ['/', '/chemicals', '/tanks', '/logs', '/export/chemicals']
+
+SERVER_COMMANDS = {
+    # What launch.py runs today
+    'dev': [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', '{port}'],
+    'production': [sys.executable, 'serve.py', '--port', '{port}'],
+}
+
+
+async def _read_response(reader):
+    """Read one HTTP/1.1 response and return (status, keep_alive)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+class HttpClient:
+    """Minimal keep-alive HTTP client for driving the app from asyncio."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=b'', content_type='application/x-www-form-urlencoded'):
+        """Send one request and return its status code."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+        if body:
+            head += f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+        self.writer.write(head.encode('latin-1') + b"\r\n" + body)
+        try:
+            status, keep_alive = await _read_response(self.reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            raise
+        if not keep_alive:
+            await self.close()
+        return status
+
+    async def close(self):
+        """Close the connection, if open."""
+        if self.writer is not None:
+            self.writer.close()
+            with contextlib.suppress(ConnectionError):
+                await self.writer.wait_closed()
+            self.reader = self.writer = None
+
+
+def percentile(sorted_values, fraction):
+    """Return a nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_level(host, port, paths, clients, duration):
+    """Hammer the server with a number of concurrent clients and collect latencies."""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(offset):
+        nonlocal errors
+        client = HttpClient(host, port)
+        i = offset
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                status = await client.request('GET', path)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                errors += 1
+                await asyncio.sleep(0.05)
+                continue
+            latencies.append(time.perf_counter() - started)
+            if status >= 500:
+                errors += 1
+        await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop(n) for n in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'clients': clients,
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'errors': errors,
+    }
+
+
+def _free_port():
+    """Pick an unused local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=30):
+    """Wait until the server accepts connections."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+def start_server(mode, db_name):
+    """Start the app in a subprocess against a copy of the database."""
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix='nuttallx_bench_')
+    db_copy = os.path.join(workdir, os.path.basename(db_name))
+    if os.path.exists(db_name):
+        shutil.copy(db_name, db_copy)
+
+    env = dict(os.environ, NUTTALLX_DB=db_copy, NUTTALLX_ARCHIVE_DIR=os.path.join(workdir, 'archives'))
+    command = [part.format(port=port) for part in SERVER_COMMANDS[mode]]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    _wait_for_port(port)
+    return process, port, workdir
+
+
+def _print_result(server, result):
+    """Print one benchmark result as a markdown table row."""
+    print(f"| {server} | {result['clients']} | {result['rps']:.1f} | {result['p50_ms']:.0f} | "
+          f"{result['p99_ms']:.0f} | {result['errors']} |", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure requests/second and latency under concurrent clients.')
+    parser.add_argument('--mode', choices=sorted(SERVER_COMMANDS), action='append',
+                        help='server to start and measure (repeatable, default: dev and production)')
+    parser.add_argument('--url', help='measure an already running server instead')
+    parser.add_argument('--db', default='AECD.db', help='database copied for the started servers')
+    parser.add_argument('--clients', type=int, action='append', help='concurrency levels (default: 50 and 200)')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per level')
+    parser.add_argument('--path', action='append', dest='paths', help=f'paths to request (default: {DEFAULT_PATHS})')
+    args = parser.parse_args()
+
+    levels = args.clients or [50, 200]
+    paths = args.paths or DEFAULT_PATHS
+    print(f"Paths: {', '.join(paths)}; {args.duration:g}s per level\n")
+    print("| Server | Clients | Requests/s | p50 (ms) | p99 (ms) | Errors |")
+    print("|---|---|---|---|---|---|")
+
+    if args.url:
+        parts = urlsplit(args.url)
+        for clients in levels:
+            _print_result('external', asyncio.run(run_level(parts.hostname, parts.port or 80, paths, clients, args.duration)))
+        return
+
+    # One server at a time so the two never compete for the CPU
+    for mode in args.mode or ['dev', 'production']:
+        process, port, workdir = start_server(mode, args.db)
+        try:
+            for clients in levels:
+                _print_result(mode, asyncio.run(run_level('127.0.0.1', port, paths, clients, args.duration)))
+        finally:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
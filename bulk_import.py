@@ -0,0 +1,191 @@
+import argparse
+import csv
+import mmap
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import descriptors
+import mixrate
+import schema
+import textstore
+
+CHUNK_BYTES = 8 * 1024 * 1024
+FORMAT_HINT = "name,mix_rate,warnings,description[,smiles=...]"
+
+# Vendor dumps repeat the same handful of mix rates on most lines
+_parse_mix_rate = lru_cache(maxsize=4096)(mixrate.parse_mix_rate)
+
+
+def chunk_ranges(filename, chunk_bytes=CHUNK_BYTES):
+    """Split a file into (start, end) byte ranges that each end on a newline."""
+    size = os.path.getsize(filename)
+    if size == 0:
+        return []
+    ranges = []
+    with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            end = data.find(b'\n', min(start + chunk_bytes, size) - 1)
+            end = size if end == -1 else end + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_record(fields):
+    """Validate one CSV record and return (name, mix_rate, mix_qty, mix_unit, warnings, description, smiles)."""
+    if len(fields) < 4:
+        raise ValueError(f"Invalid format (expected '{FORMAT_HINT}')")
+
+    # An optional trailing 'smiles=' field carries the structure
+    smiles = None
+    if len(fields) > 4 and fields[-1].strip().lower().startswith('smiles='):
+        smiles = fields.pop().strip()[len('smiles='):].strip() or None
+    # Older files have unquoted commas in the description
+    name, mix_rate, warnings = (field.strip() for field in fields[:3])
+    description = ','.join(fields[3:]).strip()
+    if not name:
+        raise ValueError("Chemical name cannot be empty")
+
+    mix_rate = f"{mix_rate} per 100 gal"
+    mix_qty, mix_unit = _parse_mix_rate(mix_rate)
+    return name, mix_rate, mix_qty, mix_unit, warnings, description, smiles
+
+
+def parse_chunk(filename, start, end):
+    """Parse one newline-aligned byte range; line numbers are relative to the chunk.
+
+    Returns (records, errors, line_count) where records are (line, parsed) pairs
+    and errors are (line, message) pairs.
+    """
+    with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode('utf-8')
+    if start == 0:
+        text = text.lstrip('\ufeff')
+
+    records = []
+    errors = []
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):  # Skip empty lines or comments
+            continue
+        # One record per line, so a stray quote cannot swallow the rest of the chunk
+        try:
+            records.append((line_number, parse_record(next(csv.reader((line,))))))
+        except (ValueError, csv.Error) as e:
+            errors.append((line_number, str(e)))
+    return records, errors, len(lines)
+
+
+def _parsed_chunks(filename, ranges, processes):
+    """Yield parsed chunks in file order, keeping a bounded number in flight."""
+    if processes <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield parse_chunk(filename, start, end)
+        return
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        ranges = iter(ranges)
+        pending = deque()
+
+        def submit_next():
+            next_range = next(ranges, None)
+            if next_range is not None:
+                pending.append(pool.submit(parse_chunk, filename, *next_range))
+
+        # A couple of chunks per process keeps the writer fed without holding the whole file
+        for _ in range(processes * 2):
+            submit_next()
+        while pending:
+            result = pending.popleft().result()
+            submit_next()
+            yield result
+
+
+def _write_batch(conn, records, line_offset):
+    """Insert one parsed chunk in a single transaction and return the added count."""
+    canonical = descriptors.cache_descriptors(conn, [parsed[6] for _, parsed in records])
+    # Boilerplate warnings repeat on most lines; look each distinct string up once per chunk
+    text_ids = {}
+
+    def text_id(text):
+        if text not in text_ids:
+            text_ids[text] = textstore.intern(conn, text)
+        return text_ids[text]
+
+    rows = []
+    for line_number, (name, mix_rate, mix_qty, mix_unit, warnings, description, smiles) in records:
+        if smiles and canonical.get(smiles) is None:
+            print(f"Line {line_offset + line_number}: Invalid SMILES '{smiles}' ignored for '{name}'")
+        rows.append((name, mix_rate, text_id(warnings), text_id(description), mix_qty, mix_unit,
+                     canonical.get(smiles) if smiles else None))
+    # Keep the interned strings even if the inserts below are rolled back
+    conn.commit()
+
+    sql = '''
+        INSERT INTO chemicals (name, mix_rate, warnings_id, description_id, mix_qty, mix_unit, smiles)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    try:
+        conn.executemany(sql, rows)
+        conn.commit()
+        return len(rows)
+    except sqlite3.IntegrityError:
+        conn.rollback()
+
+    # Only when a constraint rejects some rows: insert one by one to report them
+    added = 0
+    for (line_number, _), row in zip(records, rows, strict=True):
+        try:
+            conn.execute(sql, row)
+            added += 1
+        except sqlite3.IntegrityError:
+            print(f"Skipping line {line_offset + line_number}: Chemical '{row[0]}' already exists")
+    conn.commit()
+    return added
+
+
+def import_file(conn, filename, processes=None, chunk_bytes=CHUNK_BYTES):
+    """Parse a chemicals file in parallel and insert it through this connection.
+
+    Returns (added, skipped, elapsed_seconds).
+    """
+    processes = processes or os.cpu_count() or 1
+    size = os.path.getsize(filename)
+    started = time.perf_counter()
+
+    added = skipped = 0
+    line_offset = 0
+    for records, errors, line_count in _parsed_chunks(filename, chunk_ranges(filename, chunk_bytes), processes):
+        for line_number, message in errors:
+            print(f"Skipping line {line_offset + line_number}: {message}")
+        batch_added = _write_batch(conn, records, line_offset)
+        added += batch_added
+        skipped += len(errors) + len(records) - batch_added
+        line_offset += line_count
+
+    elapsed = time.perf_counter() - started
+    print(f"Imported {size / 1e6:.1f} MB in {elapsed:.2f}s ({size / 1e6 / max(elapsed, 1e-9):.1f} MB/s)")
+    return added, skipped, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mass import chemicals from a large CSV file.')
+    parser.add_argument('filename')
+    parser.add_argument('db_name', nargs='?', default='AECD.db')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='parser processes')
+    parser.add_argument('--chunk-mb', type=float, default=CHUNK_BYTES / (1024 * 1024))
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_name)
+    schema.ensure_schema(conn)
+    added, skipped, _ = import_file(conn, args.filename, args.processes, int(args.chunk_mb * 1024 * 1024))
+    print(f"Mass add completed: {added} chemicals added, {skipped} lines skipped.")
+    conn.close()
@@ -0,0 +1,146 @@
+import argparse
+import sqlite3
+from datetime import datetime, timedelta
+
+# Tables mirrored to offline clients, by the name the JSON API uses for them
+TRACKED_TABLES = {
+    'chemicals': 'chemicals',
+    'trucks': 'trucks',
+    'tanks': 'tanks',
+    'usage_log': 'usage_logs',
+}
+
+KEEP_DAYS = 30
+
+
+def ensure_change_log(conn):
+    """Create the change log and the triggers that fill it."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_id)')
+    # Lets table_seq() find the newest change to one table without a scan
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_table_seq ON change_log (table_name, seq)')
+
+    # Entries at or below this sequence have been compacted away
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+
+    now = "strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')"
+    for table in TRACKED_TABLES:
+        for event, op, row in (('INSERT', 'upsert', 'NEW'), ('UPDATE', 'upsert', 'NEW'), ('DELETE', 'delete', 'OLD')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS change_log_{table}_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, op, changed_at)
+                    VALUES ('{table}', {row}.id, '{op}', {now});
+                END
+            ''')
+    conn.commit()
+
+
+def _state(conn, key):
+    """Read a change log state value, defaulting to 0."""
+    row = conn.execute('SELECT value FROM change_log_state WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def latest_seq(conn):
+    """Return the newest sequence number in the change log."""
+    row = conn.execute('SELECT MAX(seq) FROM change_log').fetchone()
+    return max(row[0] or 0, _state(conn, 'compacted_through'))
+
+
+def table_seq(conn, tables):
+    """Return the newest sequence number touching any of the given tables."""
+    seq = max((conn.execute('SELECT MAX(seq) FROM change_log WHERE table_name = ?', (table,)).fetchone()[0] or 0
+               for table in tables), default=0)
+    # Compaction keeps each row's latest entry, so only the floor can hide newer history
+    return max(seq, _state(conn, 'compacted_through'))
+
+
+def read_changes(conn, since, limit):
+    """Collapse the changes after a sequence number into upserts and deletes per table.
+
+    Returns (upserts, deletes, last_seq, more) where upserts and deletes map a
+    table name to row ids, or None when the client has never synced or is
+    older than the compacted history and must download the tables again.
+    """
+    if since is None or since < _state(conn, 'compacted_through'):
+        return None
+
+    rows = conn.execute('''
+        SELECT seq, table_name, row_id, op
+        FROM change_log
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    ''', (since, limit + 1)).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Only the last change to each row matters
+    latest = {}
+    for _seq, table_name, row_id, op in rows:
+        latest[(table_name, row_id)] = op
+
+    upserts = {table: [] for table in TRACKED_TABLES}
+    deletes = {table: [] for table in TRACKED_TABLES}
+    for (table_name, row_id), op in latest.items():
+        (upserts if op == 'upsert' else deletes)[table_name].append(row_id)
+
+    last_seq = rows[-1][0] if rows else since
+    return upserts, deletes, last_seq, more
+
+
+def compact_change_log(conn, keep_days=KEEP_DAYS):
+    """Drop superseded entries and history older than keep_days.
+
+    Clients that last synced before the dropped history get a reset and
+    download the tables again.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM change_log
+        WHERE seq < (SELECT MAX(seq) FROM change_log newer
+                     WHERE newer.table_name = change_log.table_name AND newer.row_id = change_log.row_id)
+    ''')
+    superseded = cursor.rowcount
+
+    cutoff = (datetime.now() - timedelta(days=keep_days)).strftime('%Y-%m-%d %H:%M:%S')
+    floor = cursor.execute('SELECT MAX(seq) FROM change_log WHERE changed_at < ?', (cutoff,)).fetchone()[0]
+    expired = 0
+    if floor:
+        cursor.execute('DELETE FROM change_log WHERE seq <= ?', (floor,))
+        expired = cursor.rowcount
+        cursor.execute('''
+            INSERT INTO change_log_state (key, value) VALUES ('compacted_through', ?)
+            ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)
+        ''', (floor,))
+    conn.commit()
+    return superseded + expired
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compact the change log used for tablet sync.')
+    parser.add_argument('db_name', nargs='?', default='AECD.db')
+    parser.add_argument('--keep-days', type=int, default=KEEP_DAYS)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_name)
+    ensure_change_log(conn)
+    removed = compact_change_log(conn, args.keep_days)
+    print(f"Change log compacted: {removed} entries removed.")
+    conn.close()
@@ -0,0 +1,309 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import mixrate
+
+# Days after a month ends before it is closed, so late entries can still be corrected
+GRACE_DAYS = int(os.environ.get('NUTTALLX_COMPLIANCE_GRACE_DAYS', '7'))
+
+GROUPINGS = ('month', 'quarter', 'year')
+
+
+def ensure_compliance_tables(conn):
+    """Create the closed-period tables and the triggers that keep them and their logs unchanged."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS compliance_periods (
+            period TEXT PRIMARY KEY,
+            closed_at TEXT NOT NULL,
+            checksum TEXT NOT NULL
+        )
+    ''')
+    # Totals of one closed month: gallons of mix applied, entries, and product applied at the mix rate
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS compliance_totals (
+            period TEXT NOT NULL,
+            chemical_name TEXT NOT NULL,
+            mix_gallons REAL NOT NULL,
+            entry_count INTEGER NOT NULL,
+            product_amount REAL,
+            product_unit TEXT,
+            PRIMARY KEY (period, chemical_name)
+        )
+    ''')
+    for table in ('compliance_periods', 'compliance_totals'):
+        for op in ('UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_no_{op.lower()} BEFORE {op} ON {table}
+                BEGIN SELECT RAISE(ABORT, 'Closed compliance periods cannot be changed'); END
+            ''')
+    # Totals are written before their period row, in the same transaction
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS compliance_totals_closed_insert BEFORE INSERT ON compliance_totals
+        WHEN EXISTS (SELECT 1 FROM compliance_periods WHERE period = NEW.period)
+        BEGIN SELECT RAISE(ABORT, 'Closed compliance periods cannot be changed'); END
+    ''')
+
+    # Months are closed in order, so everything up to the newest closed month is frozen as far as
+    # the totals are concerned; notes stay editable. Deletes are left to the callers, since
+    # archiving moves old entries out of usage_log.
+    try:
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS usage_log_closed_insert BEFORE INSERT ON usage_log
+            WHEN substr(NEW.date_logged, 1, 7) <= (SELECT MAX(period) FROM compliance_periods)
+            BEGIN SELECT RAISE(ABORT, 'Usage logs in a closed compliance period cannot be changed'); END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS usage_log_closed_update BEFORE UPDATE ON usage_log
+            WHEN (NEW.chemical_name IS NOT OLD.chemical_name OR NEW.amount_used IS NOT OLD.amount_used
+                  OR NEW.date_logged IS NOT OLD.date_logged)
+                AND min(substr(OLD.date_logged, 1, 7), substr(NEW.date_logged, 1, 7))
+                    <= (SELECT MAX(period) FROM compliance_periods)
+            BEGIN SELECT RAISE(ABORT, 'Usage logs in a closed compliance period cannot be changed'); END
+        ''')
+    except sqlite3.OperationalError:
+        # Table not created yet (console-only database), ignore the error
+        pass
+    conn.commit()
+
+
+def _next_month(period):
+    """Return the 'YYYY-MM' after a period."""
+    year, month = map(int, period.split('-'))
+    return f"{year + month // 12}-{month % 12 + 1:02d}"
+
+
+def _months(start, end):
+    """List the 'YYYY-MM' periods from start through end."""
+    months = []
+    while start <= end:
+        months.append(start)
+        start = _next_month(start)
+    return months
+
+
+def group_key(period, by):
+    """Map a 'YYYY-MM' period to its month, quarter ('2024-Q2') or year."""
+    if by == 'quarter':
+        return f"{period[:4]}-Q{(int(period[5:7]) - 1) // 3 + 1}"
+    if by == 'year':
+        return period[:4]
+    return period
+
+
+def closed_through(conn):
+    """Return the newest closed 'YYYY-MM'; it and every month before it are closed. None if none are."""
+    return conn.execute('SELECT MAX(period) FROM compliance_periods').fetchone()[0]
+
+
+def is_closed(conn, date_logged):
+    """True if a usage log date falls in a closed period."""
+    last = closed_through(conn)
+    return last is not None and str(date_logged)[:7] <= last
+
+
+def compute_month(conn, period):
+    """Total one month from the live and archived usage logs.
+
+    Returns (chemical_name, mix_gallons, entry_count, product_amount, product_unit)
+    tuples sorted by name. A combined entry counts its full mix volume for each
+    of its chemicals; product amounts use the chemical's current mix rate.
+    """
+    rows = conn.execute('''
+        SELECT chemical_name, SUM(amount_used), COUNT(*) FROM usage_log
+        WHERE date_logged >= ? AND date_logged < ?
+        GROUP BY chemical_name
+    ''', (f"{period}-01", f"{_next_month(period)}-01")).fetchall()
+    # No archive totals table, so nothing has been archived
+    with contextlib.suppress(sqlite3.OperationalError):
+        rows += conn.execute('''
+            SELECT chemical_name, SUM(total_amount), SUM(entry_count) FROM usage_log_archive_totals
+            WHERE period = ?
+            GROUP BY chemical_name
+        ''', (period,)).fetchall()
+
+    totals = {}
+    for names, gallons, count in rows:
+        for name in names.split(', '):
+            total = totals.setdefault(name.strip(), [0.0, 0])
+            total[0] += gallons or 0.0
+            total[1] += count
+    if not totals:
+        return []
+
+    names = sorted(totals)
+    rates = {}
+    for start in range(0, len(names), 500):
+        chunk = names[start:start + 500]
+        rates.update((row[0], (row[1], row[2])) for row in conn.execute(
+            f"SELECT name, mix_qty, mix_unit FROM chemicals WHERE name IN ({', '.join('?' * len(chunk))})", chunk))
+    mix_qtys = [rates.get(name, (None, None))[0] for name in names]
+    amounts = mixrate.calculate_dosages([totals[name][0] for name in names],
+                                        [np.nan if qty is None else qty for qty in mix_qtys])
+    return [
+        (name, round(totals[name][0], 6), totals[name][1],
+         None if np.isnan(amount) else round(float(amount), 6),
+         None if np.isnan(amount) else rates[name][1])
+        for name, amount in zip(names, amounts, strict=True)
+    ]
+
+
+def checksum(period, totals):
+    """Hash a period's totals in a canonical form."""
+    payload = json.dumps([period] + [list(row) for row in totals], separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _first_unclosed_month(conn):
+    """Return the month after the last closed one, or the month of the oldest usage data."""
+    last = closed_through(conn)
+    if last:
+        return _next_month(last)
+    candidates = [conn.execute('SELECT substr(MIN(date_logged), 1, 7) FROM usage_log').fetchone()[0]]
+    with contextlib.suppress(sqlite3.OperationalError):
+        candidates.append(conn.execute('SELECT MIN(period) FROM usage_log_archive_totals').fetchone()[0])
+    candidates = [period for period in candidates if period]
+    return min(candidates) if candidates else None
+
+
+def close_periods(conn, now=None, grace_days=GRACE_DAYS):
+    """Close every complete month past the grace period that is still open; returns the periods closed."""
+    now = now or datetime.now()
+    first = _first_unclosed_month(conn)
+    if first is None:
+        return []
+    # Months before this one have ended at least grace_days ago
+    limit = (now - timedelta(days=grace_days)).strftime('%Y-%m')
+
+    closed = []
+    period = first
+    while period < limit:
+        totals = compute_month(conn, period)
+        try:
+            conn.executemany('''
+                INSERT INTO compliance_totals (period, chemical_name, mix_gallons, entry_count, product_amount, product_unit)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(period, *row) for row in totals])
+            conn.execute('INSERT INTO compliance_periods (period, closed_at, checksum) VALUES (?, ?, ?)',
+                         (period, now.strftime('%Y-%m-%d %H:%M:%S'), checksum(period, totals)))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # Another process closed it first
+            conn.rollback()
+            break
+        closed.append(period)
+        period = _next_month(period)
+    return closed
+
+
+def _closed_totals(conn, period):
+    """Read a closed month's stored totals in checksum order."""
+    return [tuple(row) for row in conn.execute('''
+        SELECT chemical_name, mix_gallons, entry_count, product_amount, product_unit
+        FROM compliance_totals WHERE period = ?
+        ORDER BY chemical_name
+    ''', (period,))]
+
+
+def verify(conn, recompute=False):
+    """Check closed periods; returns (period, problem) pairs.
+
+    The stored totals must match their checksum. With recompute the usage logs
+    are totalled again too, to find entries changed outside the app since the close.
+    """
+    problems = []
+    for period, stored_checksum in conn.execute('SELECT period, checksum FROM compliance_periods ORDER BY period').fetchall():
+        totals = _closed_totals(conn, period)
+        if checksum(period, totals) != stored_checksum:
+            problems.append((period, 'stored totals do not match their checksum'))
+        elif recompute and [row[:3] for row in compute_month(conn, period)] != [row[:3] for row in totals]:
+            problems.append((period, 'usage logs changed since the period was closed'))
+    return problems
+
+
+def summarize(conn, start, end, by='month'):
+    """Return per-chemical totals for each month, quarter or year from start through end ('YYYY-MM').
+
+    Closed months come straight from their stored totals and only open months are
+    totalled from the logs, so the cost depends on the range, not the history.
+    Each row is a dict with period, chemical_name, mix_gallons, entry_count,
+    product_amount, product_unit and closed (False if any month in it is still open).
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"'by' must be one of {', '.join(GROUPINGS)}")
+    for name, value in (('start', start), ('end', end)):
+        try:
+            datetime.strptime(value, '%Y-%m')
+        except (TypeError, ValueError):
+            raise ValueError(f"'{name}' must be a month like 2024-05") from None
+    last = closed_through(conn) or ''
+    monthly = [(row[0], row[1:]) for row in conn.execute('''
+        SELECT period, chemical_name, mix_gallons, entry_count, product_amount, product_unit
+        FROM compliance_totals WHERE period >= ? AND period <= ?
+    ''', (start, end))]
+    # Only months after the newest closed one need totalling, at most a couple in practice
+    open_months = _months(max(start, _next_month(last) if last else start), end)
+    for period in open_months:
+        if period <= datetime.now().strftime('%Y-%m'):
+            monthly.extend((period, row) for row in compute_month(conn, period))
+
+    groups = {}
+    for period, (name, gallons, count, amount, unit) in monthly:
+        key = (group_key(period, by), name)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = {'period': key[0], 'chemical_name': name, 'mix_gallons': gallons,
+                           'entry_count': count, 'product_amount': amount, 'product_unit': unit}
+            continue
+        group['mix_gallons'] = round(group['mix_gallons'] + gallons, 6)
+        group['entry_count'] += count
+        # Amounts in different units (the mix rate changed) cannot be added up
+        if group['product_amount'] is None or amount is None or group['product_unit'] != unit:
+            group['product_amount'], group['product_unit'] = None, None
+        else:
+            group['product_amount'] = round(group['product_amount'] + amount, 6)
+
+    open_groups = {group_key(period, by) for period in open_months}
+    rows = sorted(groups.values(), key=lambda row: (row['period'], row['chemical_name']))
+    for row in rows:
+        row['closed'] = row['period'] not in open_groups
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Close compliance periods and summarize applied chemical totals.')
+    parser.add_argument('db_name', nargs='?', default='AECD.db')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('close', help='close every complete month past the grace period')
+    verify_parser = commands.add_parser('verify', help='check closed periods against their checksums')
+    verify_parser.add_argument('--recompute', action='store_true', help='also total the usage logs again')
+    summary = commands.add_parser('summary', help='print per-chemical totals')
+    summary.add_argument('start', help='first month, YYYY-MM')
+    summary.add_argument('end', help='last month, YYYY-MM')
+    summary.add_argument('--by', choices=GROUPINGS, default='month')
+    args = parser.parse_args()
+
+    import schema
+    conn = sqlite3.connect(args.db_name)
+    schema.ensure_schema(conn)
+    if args.command == 'close':
+        periods = close_periods(conn)
+        print(f"Closed {len(periods)} period(s){': ' + ', '.join(periods) if periods else '.'}")
+    elif args.command == 'verify':
+        problems = verify(conn, args.recompute)
+        for period, problem in problems:
+            print(f"{period}: {problem}")
+        print("All closed periods verified." if not problems else f"{len(problems)} problem(s) found.")
+    else:
+        for row in summarize(conn, args.start, args.end, args.by):
+            amount = f"{row['product_amount']} {row['product_unit']}" if row['product_amount'] is not None else 'unknown'
+            print(f"{row['period']} {'closed' if row['closed'] else 'open  '} {row['chemical_name']}: "
+                  f"{row['mix_gallons']} gal of mix in {row['entry_count']} entries, {amount} of product")
+    conn.close()
@@ -0,0 +1,120 @@
+import contextlib
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    from rdkit import Chem, RDLogger, rdBase
+    from rdkit.Chem import Crippen, Descriptors
+    RDLogger.DisableLog('rdApp.*')
+    RDKIT_AVAILABLE = True
+except ImportError:
+    RDKIT_AVAILABLE = False
+
+# Substructures worth flagging on an applicator's data sheet
+HAZARD_SMARTS = {
+    'organophosphate': 'P(=[O,S])([O,S])[O,S]',
+    'carbamate': '[NX3][CX3](=O)[OX2][#6]',
+    'halogenated aromatic': 'c[F,Cl,Br,I]',
+    'nitro group': '[$([NX3](=O)=O),$([NX3+](=O)[O-])]',
+    'isocyanate': 'N=C=O',
+    'epoxide': 'C1OC1',
+    'heavy metal': '[Cu,Hg,As,Pb,Cd,Sn]',
+}
+
+# Below this many uncached structures the process pool costs more than it saves
+POOL_THRESHOLD = 32
+
+_hazard_patterns = None
+
+
+def ensure_descriptor_tables(conn):
+    """Add the SMILES column to chemicals and create the descriptor cache."""
+    cursor = conn.cursor()
+    # The column may already exist
+    with contextlib.suppress(sqlite3.OperationalError):
+        cursor.execute('ALTER TABLE chemicals ADD COLUMN smiles TEXT')
+
+    # Computed once per structure; chemicals.smiles holds the canonical key
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chemical_descriptors (
+            canonical_smiles TEXT PRIMARY KEY,
+            mol_weight REAL,
+            logp REAL,
+            hazard_flags TEXT,
+            rdkit_version TEXT,
+            computed_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def compute_descriptors(smiles):
+    """Compute (canonical SMILES, MW, logP, hazard flags) for one structure, or None if invalid."""
+    global _hazard_patterns
+    mol = Chem.MolFromSmiles(smiles)
+    if mol is None:
+        return None
+    if _hazard_patterns is None:
+        _hazard_patterns = {name: Chem.MolFromSmarts(smarts) for name, smarts in HAZARD_SMARTS.items()}
+    flags = [name for name, pattern in _hazard_patterns.items() if mol.HasSubstructMatch(pattern)]
+    return (
+        Chem.MolToSmiles(mol),
+        round(Descriptors.MolWt(mol), 3),
+        round(Crippen.MolLogP(mol), 3),
+        ', '.join(flags),
+    )
+
+
+def cache_descriptors(conn, smiles_list, processes=None):
+    """Make sure descriptors exist for every SMILES and return a map of input -> canonical SMILES.
+
+    Structures already in the cache are not recomputed; large batches are
+    computed in a process pool. Invalid structures map to None. Without
+    RDKit the input strings are kept as given and nothing is computed.
+    """
+    pending = sorted({smiles.strip() for smiles in smiles_list if smiles and smiles.strip()})
+    if not RDKIT_AVAILABLE:
+        return {smiles: smiles for smiles in pending}
+
+    # Inputs that are already canonical cache keys need no work at all
+    canonical = {}
+    for start in range(0, len(pending), 500):
+        batch = pending[start:start + 500]
+        rows = conn.execute(f'''
+            SELECT canonical_smiles FROM chemical_descriptors
+            WHERE canonical_smiles IN ({','.join('?' * len(batch))})
+        ''', batch).fetchall()
+        canonical.update({row[0]: row[0] for row in rows})
+    pending = [smiles for smiles in pending if smiles not in canonical]
+    if not pending:
+        return canonical
+
+    if len(pending) >= POOL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count()) as pool:
+            results = list(pool.map(compute_descriptors, pending, chunksize=64))
+    else:
+        results = [compute_descriptors(smiles) for smiles in pending]
+
+    computed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    conn.executemany('''
+        INSERT OR IGNORE INTO chemical_descriptors
+            (canonical_smiles, mol_weight, logp, hazard_flags, rdkit_version, computed_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(*result, rdBase.rdkitVersion, computed_at) for result in results if result])
+    conn.commit()
+
+    for smiles, result in zip(pending, results, strict=True):
+        canonical[smiles] = result[0] if result else None
+    return canonical
+
+
+def format_descriptors(mol_weight, logp, hazard_flags):
+    """Format cached descriptors for a view or report cell."""
+    if mol_weight is None:
+        return '-'
+    text = f"MW {mol_weight:g}, logP {logp:g}"
+    if hazard_flags:
+        text += f"; {hazard_flags}"
+    return text
@@ -0,0 +1,173 @@
+import argparse
+import contextlib
+import sqlite3
+from datetime import datetime
+
+# Tanks at or below this fraction of capacity are reported as low, unless they set their own threshold
+LOW_LEVEL_FRACTION = 0.2
+
+EVENT_TYPES = ('fill', 'refill', 'usage', 'adjustment')
+
+
+def ensure_inventory_tables(conn):
+    """Create the tank level columns and the tank event history."""
+    cursor = conn.cursor()
+
+    # Running level per tank, kept in step with tank_events by every writer
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(tanks)')]
+    adding_level = False
+    if 'current_level' not in columns:
+        # Another process upgrading at the same moment may add it first; that one seeds the levels
+        with contextlib.suppress(sqlite3.OperationalError):
+            cursor.execute('ALTER TABLE tanks ADD COLUMN current_level REAL NOT NULL DEFAULT 0')
+            adding_level = True
+    if 'low_level_threshold' not in columns:
+        with contextlib.suppress(sqlite3.OperationalError):
+            cursor.execute('ALTER TABLE tanks ADD COLUMN low_level_threshold REAL')
+
+    # Every change to a tank's contents, stored as a signed delta
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tank_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tank_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            amount REAL NOT NULL,
+            usage_log_id INTEGER,
+            date_logged TEXT NOT NULL,
+            notes TEXT,
+            FOREIGN KEY (tank_id) REFERENCES tanks (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tank_events_tank ON tank_events (tank_id)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tank_events_usage_log ON tank_events (usage_log_id)')
+
+    if adding_level:
+        # Existing tanks start out full rather than empty, recorded as an adjustment so that
+        # reconcile_levels rebuilds the same level
+        date_logged = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cursor.execute('''
+            INSERT INTO tank_events (tank_id, event_type, amount, date_logged, notes)
+            SELECT id, 'adjustment', capacity, ?, 'Opening level' FROM tanks WHERE capacity > 0
+        ''', (date_logged,))
+        cursor.execute('UPDATE tanks SET current_level = capacity WHERE capacity > 0')
+    conn.commit()
+
+
+def _add_event(conn, tank_id, event_type, amount, date_logged, usage_log_id=None, notes=''):
+    """Insert a tank event and apply its delta to the running level."""
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f"Unknown tank event type '{event_type}'")
+    conn.execute('''
+        INSERT INTO tank_events (tank_id, event_type, amount, usage_log_id, date_logged, notes)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (tank_id, event_type, amount, usage_log_id, date_logged, notes))
+    conn.execute('UPDATE tanks SET current_level = current_level + ? WHERE id = ?', (amount, tank_id))
+
+
+def _tank_id(conn, tank_name):
+    """Look up a tank id by name."""
+    row = conn.execute('SELECT id FROM tanks WHERE tank_name = ?', (tank_name,)).fetchone()
+    return row[0] if row else None
+
+
+def _drawable(conn, tank_id, amount_used):
+    """Limit a draw-down to what the tank holds, so its level never goes below zero."""
+    level = conn.execute('SELECT current_level FROM tanks WHERE id = ?', (tank_id,)).fetchone()[0]
+    return min(amount_used, max(level, 0))
+
+
+def record_usage(conn, usage_log_id, tank_name, amount_used, date_logged):
+    """Draw down a tank for a newly logged usage, emptying it at most. The caller commits."""
+    tank_id = _tank_id(conn, tank_name)
+    if tank_id is None:
+        return
+    _add_event(conn, tank_id, 'usage', -_drawable(conn, tank_id, amount_used), date_logged, usage_log_id)
+
+
+def revise_usage(conn, usage_log_id, tank_name, amount_used):
+    """Move an edited usage log's draw-down to its new tank and amount. The caller commits."""
+    event = conn.execute('SELECT id, tank_id, amount FROM tank_events WHERE usage_log_id = ?',
+                         (usage_log_id,)).fetchone()
+    if not event:
+        # Logs written before level tracking never affected the levels
+        return
+    event_id, old_tank_id, old_amount = event[0], event[1], event[2]
+    new_tank_id = _tank_id(conn, tank_name)
+    if new_tank_id is None:
+        new_tank_id = old_tank_id
+
+    # Return the old draw-down first, so the new one is limited by what the tank then holds
+    conn.execute('UPDATE tanks SET current_level = current_level - ? WHERE id = ?', (old_amount, old_tank_id))
+    drawn = _drawable(conn, new_tank_id, amount_used)
+    conn.execute('UPDATE tanks SET current_level = current_level - ? WHERE id = ?', (drawn, new_tank_id))
+    conn.execute('UPDATE tank_events SET tank_id = ?, amount = ? WHERE id = ?',
+                 (new_tank_id, -drawn, event_id))
+
+
+def remove_usage(conn, usage_log_id):
+    """Return a deleted usage log's amount to its tank. The caller commits."""
+    event = conn.execute('SELECT id, tank_id, amount FROM tank_events WHERE usage_log_id = ?',
+                         (usage_log_id,)).fetchone()
+    if not event:
+        return
+    conn.execute('UPDATE tanks SET current_level = current_level - ? WHERE id = ?', (event[2], event[1]))
+    conn.execute('DELETE FROM tank_events WHERE id = ?', (event[0],))
+
+
+def record_fill(conn, tank_id, amount=None, notes=''):
+    """Fill a tank to capacity, or refill it by a given amount. The caller commits."""
+    tank = conn.execute('SELECT capacity, current_level FROM tanks WHERE id = ?', (tank_id,)).fetchone()
+    if not tank:
+        raise ValueError('Tank not found')
+
+    date_logged = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if amount is None:
+        if not tank[0]:
+            raise ValueError('Tank has no capacity set, enter the amount added')
+        _add_event(conn, tank_id, 'fill', tank[0] - tank[1], date_logged, notes=notes)
+    elif amount <= 0:
+        raise ValueError('Enter an amount greater than zero')
+    else:
+        _add_event(conn, tank_id, 'refill', amount, date_logged, notes=notes)
+
+
+def low_level_tanks(conn, fraction=LOW_LEVEL_FRACTION):
+    """List tanks at or below their low-level threshold."""
+    return conn.execute('''
+        SELECT id, tank_name, capacity, current_level, truck_id
+        FROM tanks
+        WHERE current_level <= COALESCE(low_level_threshold, capacity * ?)
+        ORDER BY tank_name
+    ''', (fraction,)).fetchall()
+
+
+def reconcile_levels(conn):
+    """Rebuild every tank's level from its event history and return the tanks that drifted."""
+    drifted = conn.execute('''
+        SELECT t.id, t.tank_name, t.current_level, COALESCE(SUM(e.amount), 0) AS event_level
+        FROM tanks t
+        LEFT JOIN tank_events e ON e.tank_id = t.id
+        GROUP BY t.id
+        HAVING ABS(t.current_level - COALESCE(SUM(e.amount), 0)) > 1e-9
+    ''').fetchall()
+    conn.execute('''
+        UPDATE tanks
+        SET current_level = COALESCE((SELECT SUM(amount) FROM tank_events WHERE tank_id = tanks.id), 0)
+    ''')
+    conn.commit()
+    return drifted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild tank levels from the tank event history.')
+    parser.add_argument('db_name', nargs='?', default='AECD.db')
+    args = parser.parse_args()
+
+    import schema
+    conn = sqlite3.connect(args.db_name)
+    schema.ensure_schema(conn)
+    drifted = reconcile_levels(conn)
+    for tank_id, tank_name, stored, rebuilt in drifted:
+        print(f"Tank '{tank_name}' (id {tank_id}): {stored} -> {rebuilt}")
+    print(f"Reconciliation completed: {len(drifted)} tank level(s) corrected.")
+    conn.close()
@@ -4,7 +4,8 @@ def main():
     print("=== NUTtall X Launcher ===")
     print("1. Run Console Application")
     print("2. Run Web Application (Flask)")
-    choice = input("Choose an option (1 or 2): ").strip()
+    print("3. Run Web Application (Production Server)")
+    choice = input("Choose an option (1-3): ").strip()
 
     if choice == '1':
         os.system("python3 main.py")
@@ -13,6 +14,9 @@ def main():
         os.environ["FLASK_APP"] = "app.py"
         os.environ["FLASK_RUN_PORT"] = "3000"
         os.system("flask run --host=0.0.0.0")
+    elif choice == '3':
+        print("Launching production web server on port 3000...")
+        os.system("python3 serve.py --port 3000")
     else:
         print("Invalid choice. Exiting.")
 
@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlencode, urlsplit
+from urllib.request import urlopen
+
+from benchmark import HttpClient, percentile, start_server
+
+try:
+    import fcntl
+except ImportError:
+    # No POSIX record locks to inspect; the lock probe is skipped
+    fcntl = None
+
+RESULTS_DIR = 'loadtest_results'
+
+# Where SQLite's unix VFS takes its write lock: a byte of the -shm file in WAL mode,
+# the RESERVED byte of the database file in rollback-journal mode
+WAL_WRITE_LOCK_BYTE = 120
+RESERVED_LOCK_BYTE = 0x40000001
+
+# Share of requests per scenario; override with --mix name=weight,...
+DEFAULT_MIX = {
+    'dashboard': 40,
+    'log_usage': 20,
+    'browse_logs': 25,
+    'export_pdf': 15,
+}
+
+NOTES = ['', 'Windy, used drift guard', 'Handle with gloves', 'Refilled before run', 'Customer requested follow-up']
+
+
+def _export_path(rng):
+    """Pick one of the PDF exports, mostly the filtered ones crews actually use."""
+    end = datetime.now() - timedelta(days=rng.randint(0, 30))
+    start = end - timedelta(days=7)
+    return rng.choice([
+        '/export/chemicals',
+        '/export/tanks',
+        f"/export/logs?start={start.strftime('%Y-%m-%d')}&end={end.strftime('%Y-%m-%d')}",
+        '/export/logs',
+    ])
+
+
+def _next_request(scenario, rng, reference):
+    """Build (method, path, body) for one request of a scenario."""
+    if scenario == 'dashboard':
+        return 'GET', '/', b''
+    if scenario == 'browse_logs':
+        return 'GET', '/logs', b''
+    if scenario == 'export_pdf':
+        return 'GET', _export_path(rng), b''
+    if scenario == 'log_usage':
+        chemicals = rng.sample(reference['chemicals'], min(len(reference['chemicals']), rng.randint(1, 2)))
+        body = urlencode([('chemical_names', name) for name in chemicals] + [
+            ('tank_name', rng.choice(reference['tanks']) if reference['tanks'] else ''),
+            ('amount_used', f"{rng.uniform(0.5, 50):.1f}"),
+            ('notes', rng.choice(NOTES)),
+        ]).encode('utf-8')
+        return 'POST', '/log', body
+    raise ValueError(f"Unknown scenario '{scenario}'")
+
+
+def load_reference_data(base_url):
+    """Fetch chemical and tank names through the JSON API for realistic /log posts."""
+    def names(resource, field):
+        names, after = [], None
+        while True:
+            url = f"{base_url}/api/v1/{resource}?fields={field}&limit=1000" + (f"&after={after}" if after else '')
+            with urlopen(url, timeout=30) as response:
+                page = json.load(response)
+            names.extend(row[1] for row in page['rows'])
+            after = page['next_after']
+            if after is None:
+                return names
+    return {'chemicals': names('chemicals', 'name'), 'tanks': names('tanks', 'tank_name')}
+
+
+async def _run_clients(host, port, clients, duration, mix, reference, seed, started_at):
+    """Drive the server from one process and return (offset, scenario, latency, status) samples."""
+    samples = []
+    scenarios = list(mix)
+    weights = [mix[name] for name in scenarios]
+    deadline = started_at + duration
+
+    async def client_loop(index):
+        rng = random.Random(seed * 1000 + index)
+        client = HttpClient(host, port)
+        while time.time() < deadline:
+            scenario = rng.choices(scenarios, weights)[0]
+            method, path, body = _next_request(scenario, rng, reference)
+            sent = time.time()
+            try:
+                status = await client.request(method, path, body)
+            except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                status = 0
+                await asyncio.sleep(0.05)
+            samples.append((sent - started_at, scenario, time.time() - sent, status))
+        await client.close()
+
+    await asyncio.gather(*(client_loop(index) for index in range(clients)))
+    return samples
+
+
+def _client_process(host, port, clients, duration, mix, reference, seed, started_at):
+    """Entry point of one load-generating process."""
+    return asyncio.run(_run_clients(host, port, clients, duration, mix, reference, seed, started_at))
+
+
+def _process_tree_rss(pid):
+    """Return the resident memory in MB of a process and its children, or None if unavailable."""
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as file:
+                    pending.extend(int(child) for child in file.read().split())
+        except OSError:
+            if current == pid:
+                return None
+    return total_kb / 1024
+
+
+def _lock_held(fd, offset):
+    """Ask the OS whether another process holds a lock on one byte, without taking it."""
+    # struct flock: l_type, l_whence, l_start, l_len, l_pid
+    request = struct.pack('hhqqi', fcntl.F_WRLCK, os.SEEK_SET, offset, 1, 0)
+    return struct.unpack('hhqqi', fcntl.fcntl(fd, fcntl.F_GETLK, request))[0] != fcntl.F_UNLCK
+
+
+class Monitor(threading.Thread):
+    """Sample server memory and watch the SQLite write lock while the test runs.
+
+    The lock is only inspected, never taken, so probing cannot slow down the
+    writers being measured.
+    """
+
+    def __init__(self, db_path, pid, interval=0.25):
+        super().__init__(daemon=True)
+        self.db_path = db_path if fcntl else None
+        self.pid = pid
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.memory = []
+        self.probes = 0
+        self.lock_held_samples = 0
+        self.lock_held_seconds = 0.0
+        self._files = {}
+
+    def _fd(self, path):
+        """Return a read-only descriptor for path, or None while the file does not exist."""
+        if path not in self._files:
+            try:
+                self._files[path] = os.open(path, os.O_RDONLY)
+            except OSError:
+                return None
+        return self._files[path]
+
+    def _write_lock_held(self):
+        shm = self._fd(f"{self.db_path}-shm")
+        if shm is not None and _lock_held(shm, WAL_WRITE_LOCK_BYTE):
+            return True
+        db = self._fd(self.db_path)
+        return db is not None and _lock_held(db, RESERVED_LOCK_BYTE)
+
+    def _probe_lock(self):
+        """Check whether a writer holds the lock; if so, count it and time how long it stays held."""
+        self.probes += 1
+        if not self._write_lock_held():
+            return
+        self.lock_held_samples += 1
+        started = time.perf_counter()
+        while self._write_lock_held() and time.perf_counter() - started < 5 and not self.stopped.is_set():
+            time.sleep(0.001)
+        self.lock_held_seconds += time.perf_counter() - started
+
+    def run(self):
+        started = time.time()
+        try:
+            while not self.stopped.wait(self.interval):
+                if self.pid:
+                    rss = _process_tree_rss(self.pid)
+                    if rss is not None:
+                        self.memory.append((round(time.time() - started, 2), round(rss, 1)))
+                if self.db_path:
+                    self._probe_lock()
+        finally:
+            # The monitor holds no locks, so closing these cannot release anyone else's
+            for fd in self._files.values():
+                os.close(fd)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def summarize(samples, duration, monitor, bucket_seconds=5):
+    """Turn raw samples into overall, per-scenario and over-time statistics."""
+    def stats(latencies, errors):
+        latencies = sorted(latencies)
+        return {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / duration, 2),
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'max_ms': round((latencies[-1] if latencies else 0) * 1000, 1),
+        }
+
+    def failed(status):
+        return status == 0 or status >= 500
+
+    result = {'overall': stats([s[2] for s in samples], sum(failed(s[3]) for s in samples)), 'scenarios': {}}
+    for scenario in sorted({s[1] for s in samples}):
+        subset = [s for s in samples if s[1] == scenario]
+        result['scenarios'][scenario] = stats([s[2] for s in subset], sum(failed(s[3]) for s in subset))
+
+    timeline = []
+    for start in range(0, int(duration + 0.999), bucket_seconds):
+        bucket = sorted(s[2] for s in samples if start <= s[0] < start + bucket_seconds)
+        memory = [mb for offset, mb in monitor.memory if start <= offset < start + bucket_seconds]
+        timeline.append({
+            'second': start,
+            'rps': round(len(bucket) / min(bucket_seconds, duration - start), 2),
+            'p95_ms': round(percentile(bucket, 0.95) * 1000, 1),
+            'rss_mb': max(memory) if memory else None,
+        })
+    result['timeline'] = timeline
+
+    memory = [mb for _, mb in monitor.memory]
+    result['memory'] = {
+        'start_mb': memory[0] if memory else None,
+        'peak_mb': max(memory) if memory else None,
+        'end_mb': memory[-1] if memory else None,
+        'growth_mb': round(memory[-1] - memory[0], 1) if memory else None,
+    }
+    result['sqlite_locks'] = {
+        'probes': monitor.probes,
+        # Probes that found the lock held, not waits by any writer
+        'lock_held_samples': monitor.lock_held_samples,
+        'held_ratio': round(monitor.lock_held_samples / monitor.probes, 3) if monitor.probes else None,
+        'held_seconds': round(monitor.lock_held_seconds, 3),
+    }
+    return result
+
+
+def run_load_test(host, port, processes, clients, duration, mix, reference, db_path=None, pid=None):
+    """Run the clients across processes and return the summarized result."""
+    monitor = Monitor(db_path, pid)
+    monitor.start()
+    # Clients in every process share one clock so the timelines line up
+    started_at = time.time() + 0.5
+    per_process = [clients // processes + (1 if n < clients % processes else 0) for n in range(processes)]
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes) as pool:
+        chunks = pool.starmap(_client_process, [
+            (host, port, count, duration, mix, reference, seed, started_at)
+            for seed, count in enumerate(per_process) if count
+        ])
+    monitor.stop()
+    samples = [sample for chunk in chunks for sample in chunk]
+    return summarize(samples, duration, monitor)
+
+
+def print_result(result):
+    """Print a result as markdown tables."""
+    print("| Scenario | Requests | Req/s | p50 (ms) | p95 (ms) | p99 (ms) | Errors |")
+    print("|---|---|---|---|---|---|---|")
+    for name, stats in [('all', result['overall'])] + sorted(result['scenarios'].items()):
+        print(f"| {name} | {stats['requests']} | {stats['rps']} | {stats['p50_ms']} | {stats['p95_ms']} | "
+              f"{stats['p99_ms']} | {stats['errors']} |")
+    locks = result['sqlite_locks']
+    memory = result['memory']
+    print(f"\nSQLite write lock held in {locks['lock_held_samples']} of {locks['probes']} probes "
+          f"(held {locks['held_seconds']}s in total)")
+    if memory['start_mb'] is not None:
+        print(f"Server memory: {memory['start_mb']} MB -> {memory['end_mb']} MB "
+              f"(peak {memory['peak_mb']} MB, growth {memory['growth_mb']} MB)")
+    print("\n| Second | Req/s | p95 (ms) | RSS (MB) |")
+    print("|---|---|---|---|")
+    for bucket in result['timeline']:
+        print(f"| {bucket['second']} | {bucket['rps']} | {bucket['p95_ms']} | {bucket['rss_mb'] or '-'} |")
+
+
+def save_result(result, label):
+    """Write a result to the results directory and return its path."""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{quote(label, safe='')}.json")
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(result, file, indent=2)
+    return path
+
+
+def compare_results(paths):
+    """Print the headline numbers of saved runs side by side."""
+    runs = []
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            runs.append((os.path.basename(path), json.load(file)))
+    print("| Run | Clients | Req/s | p50 (ms) | p95 (ms) | p99 (ms) | Errors | Lock held samples | Memory growth (MB) |")
+    print("|---|---|---|---|---|---|---|---|---|")
+    for name, result in runs:
+        overall = result['overall']
+        print(f"| {name} | {result['config']['clients']} | {overall['rps']} | {overall['p50_ms']} | "
+              f"{overall['p95_ms']} | {overall['p99_ms']} | {overall['errors']} | "
+              f"{result['sqlite_locks']['lock_held_samples']} | {result['memory']['growth_mb']} |")
+
+
+def _parse_mix(text):
+    """Parse 'dashboard=40,log_usage=20' into scenario weights."""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown scenario '{name.strip()}' (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate field crews against the app and find its throughput ceiling.')
+    parser.add_argument('--mode', choices=['dev', 'production'], default='production',
+                        help='server to start against a copy of the database')
+    parser.add_argument('--url', help='load an already running server instead')
+    parser.add_argument('--pid', type=int, help='with --url: server process to sample memory from')
+    parser.add_argument('--db', default='AECD.db',
+                        help="database copied for the started server; with --url, the server's database to probe")
+    parser.add_argument('--clients', type=int, default=50, help='concurrent simulated clients')
+    parser.add_argument('--processes', type=int, default=min(4, os.cpu_count() or 1), help='load-generating processes')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds to run')
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX, help='scenario weights, e.g. dashboard=40,log_usage=20')
+    parser.add_argument('--label', help='name for the saved result (default: mode and clients)')
+    parser.add_argument('--compare', nargs='+', metavar='RESULT', help='compare saved result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(args.compare)
+        return
+
+    process = workdir = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+        db_path, pid = (args.db if os.path.exists(args.db) else None), args.pid
+    else:
+        process, port, workdir = start_server(args.mode, args.db)
+        host, pid = '127.0.0.1', process.pid
+        db_path = os.path.join(workdir, os.path.basename(args.db))
+
+    try:
+        reference = load_reference_data(f"http://{host}:{port}")
+        print(f"Running {args.clients} clients in {args.processes} processes for {args.duration:g}s "
+              f"({', '.join(f'{name}={weight:g}' for name, weight in args.mix.items())})\n")
+        result = run_load_test(host, port, max(1, min(args.processes, args.clients)), args.clients,
+                               args.duration, args.mix, reference, db_path, pid)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result['config'] = {
+        'target': args.url or args.mode,
+        'clients': args.clients,
+        'processes': args.processes,
+        'duration': args.duration,
+        'mix': args.mix,
+        'started': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    print_result(result)
+    label = args.label or f"{'external' if args.url else args.mode}_{args.clients}"
+    print(f"\nSaved {save_result(result, label)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,12 @@
-import sqlite3
 import os
 import time
+import bulk_import
+import descriptors
+import mixrate
+import reports
+import schema
+import sqlprofile
+import textstore
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.utils import ImageReader
@@ -39,18 +45,10 @@ def select_or_create_database():
 
 def create_or_open_database(db_name):
     """Create or open a SQLite database for storing chemical data."""
-    conn = sqlite3.connect(db_name)
+    conn = sqlprofile.connect(db_name)
+    # Same schema as the web app, so either can open a database the other created
+    schema.ensure_schema(conn)
     cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chemicals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            mix_rate TEXT,
-            warnings TEXT,
-            description TEXT
-        )
-    ''')
-    conn.commit()
     return conn, cursor
 
 
@@ -84,16 +82,19 @@ def delete_database():
         print("Invalid input. Deletion cancelled.")
 
 
-def add_chemical(cursor, name, mix_rate, warnings, description):
-    """Add a chemical to the database."""
-    cursor.execute('INSERT INTO chemicals (name, mix_rate, warnings, description) VALUES (?, ?, ?, ?)',
-                   (name, mix_rate, warnings, description))
+def add_chemical(cursor, name, mix_rate, warnings, description, smiles=None):
+    """Add a chemical to the database. smiles should already be canonical."""
+    mix_qty, mix_unit = mixrate.parse_mix_rate(mix_rate)
+    conn = cursor.connection
+    cursor.execute('INSERT INTO chemicals (name, mix_rate, warnings_id, description_id, mix_qty, mix_unit, smiles) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   (name, mix_rate, textstore.intern(conn, warnings), textstore.intern(conn, description), mix_qty, mix_unit, smiles))
     return name
 
 def create_sample_file(filename):
     """Create a sample text file for mass adding chemicals."""
-    sample_content = """Acorn Fertilizer,2 oz,Handle with gloves,High-nitrogen blend for tree growth
-Acorn Soil Conditioner,1 lb,Avoid inhalation,Improves soil structure"""
+    sample_content = """Acorn Fertilizer,2 oz wt,Handle with gloves,High-nitrogen blend for tree growth
+Acorn Soil Conditioner,1 lb,Avoid inhalation,Improves soil structure
+Acorn Urea Feed,3 oz wt,Avoid eye contact,Slow-release nitrogen,smiles=NC(N)=O"""
     try:
         with open(filename, 'w') as file:
             file.write(sample_content)
@@ -113,27 +114,9 @@ def mass_add_chemicals(cursor, filename):
             create_sample_file(filename)
         return
 
-    added_count = 0
     try:
-        with open(filename, 'r', encoding='utf-8') as file:
-            for line_number, line in enumerate(file, 1):
-                line = line.strip()
-                if not line or line.startswith('#'):  # Skip empty lines or comments
-                    continue
-                parts = line.split(',', 3)  # Split into at most 4 parts
-                if len(parts) != 4:
-                    print(f"Skipping line {line_number}: Invalid format (expected 'name,mix_rate,warnings,description')")
-                    continue
-                name, mix_rate, warnings, description = [part.strip() for part in parts]
-                if not name:
-                    print(f"Skipping line {line_number}: Chemical name cannot be empty")
-                    continue
-                try:
-                    add_chemical(cursor, name, f"{mix_rate} per 100 gal", warnings, description)
-                    print(f"Line {line_number}: Added '{name}'")
-                    added_count += 1
-                except sqlite3.IntegrityError:
-                    print(f"Skipping line {line_number}: Chemical '{name}' already exists")
+        # Parsed in parallel from a memory map; large vendor dumps use every core
+        added_count, _, _ = bulk_import.import_file(cursor.connection, filename)
         print(f"Mass add completed: {added_count} chemicals added.")
     except Exception as e:
         print(f"Error processing file '{filename}': {e}")
@@ -151,7 +134,10 @@ def edit_chemical(cursor):
     name = input("Enter the name of the chemical you want to edit: ").strip()
 
     # Check if chemical exists
-    cursor.execute('SELECT * FROM chemicals WHERE name = ?', (name,))
+    cursor.execute(f'''
+        SELECT id, name, mix_rate, {textstore.decoded('warnings')}, {textstore.decoded('description')}, smiles
+        FROM chemicals WHERE name = ?
+    ''', (name,))
     row = cursor.fetchone()
     if not row:
         print(f"No chemical found with the name '{name}'.")
@@ -164,33 +150,52 @@ def edit_chemical(cursor):
     new_mix_rate = input(f"New mix rate [{row[2]}]: ") or row[2]
     new_warnings = input(f"New warnings [{row[3]}]: ") or row[3]
     new_description = input(f"New description [{row[4]}]: ") or row[4]
+    new_smiles = input(f"New SMILES [{row[5] or ''}]: ").strip() or row[5]
+    mix_qty, mix_unit = mixrate.parse_mix_rate(new_mix_rate)
+    if new_smiles and new_smiles != row[5]:
+        canonical = descriptors.cache_descriptors(cursor.connection, [new_smiles])
+        if canonical.get(new_smiles) is None:
+            print(f"Invalid SMILES '{new_smiles}', keeping the current structure.")
+            new_smiles = row[5]
+        else:
+            new_smiles = canonical[new_smiles]
 
     cursor.execute('''
         UPDATE chemicals
-        SET name = ?, mix_rate = ?, warnings = ?, description = ?
+        SET name = ?, mix_rate = ?, warnings = NULL, description = NULL, warnings_id = ?, description_id = ?,
+            mix_qty = ?, mix_unit = ?, smiles = ?
         WHERE id = ?
-    ''', (new_name, new_mix_rate, new_warnings, new_description, row[0]))
+    ''', (new_name, new_mix_rate, textstore.intern(cursor.connection, new_warnings),
+          textstore.intern(cursor.connection, new_description), mix_qty, mix_unit, new_smiles, row[0]))
 
     print(f"Chemical '{name}' has been updated to '{new_name}'.")
 
 
-def view_chemicals(cursor):
-    """Display all chemicals in the database."""
-    cursor.execute('SELECT name, mix_rate, warnings, description FROM chemicals')
-    rows = cursor.fetchall()
-    if not rows:
+def print_chemical(chem):
+    """Print one chemical row from reports.fetch_chemicals."""
+    line = f"Name: {chem['name']}, Mix Rate: {chem['mix_rate']}, Warnings: {chem['warnings']}, Description: {chem['description']}"
+    if chem['mol_weight'] is not None:
+        line += f", Properties: {descriptors.format_descriptors(chem['mol_weight'], chem['logp'], chem['hazard_flags'])}"
+    print(line)
+
+def view_chemicals(cursor, filters=None):
+    """Display all chemicals in the database, or those matching report filters, and return how many."""
+    count = 0
+    # Printed as they are read, so large inventories are never held in memory
+    for chem in reports.fetch_chemicals(cursor.connection, filters):
+        if not count:
+            print("\nCurrent Chemicals:")
+        print_chemical(chem)
+        count += 1
+    if not count:
         print("No chemicals in the database.")
-        return []
-    print("\nCurrent Chemicals:")
-    for row in rows:
-        print(f"Name: {row[0]}, Mix Rate: {row[1]}, Warnings: {row[2]}, Description: {row[3]}")
-    return rows
+    return count
 
-def generate_pdf(db_name, output_pdf, company_info, subcontractor, title="Squirrel TEcH LLC Chemical Inventory", logo_path="squirrel_logo.png"):
+def generate_pdf(db_name, output_pdf, company_info, subcontractor, title="Squirrel TEcH LLC Chemical Inventory", logo_path="squirrel_logo.png", filters=None):
 
-    """Generate a wrapped PDF report using Platypus."""
+    """Generate a wrapped PDF report using Platypus, optionally limited by reports.FILTER_NAMES filters."""
+    filters = reports.normalize_filters(filters)
     conn, cursor = create_or_open_database(db_name)
-    chemicals = view_chemicals(cursor)
 
     doc = SimpleDocTemplate(output_pdf, pagesize=letter,
                             rightMargin=30, leftMargin=30,
@@ -224,26 +229,46 @@ def generate_pdf(db_name, output_pdf, company_info, subcontractor, title="Squirr
         elements.append(Paragraph(f"<b>Address:</b> {company_info['address']}", styleN))
     if subcontractor:
         elements.append(Paragraph(f"Subcontractor: {subcontractor}", styleN))
+    if filters and reports.describe_filters(filters):
+        elements.append(Paragraph(f"<b>Filtered to:</b> {reports.describe_filters(filters)}", styleN))
     elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styleN))
     elements.append(Spacer(1, 24))
 
-    # Table headers
+    # Table headers, with a properties column when any structures are known
+    # (the rows are streamed once, so an unused column is dropped afterwards)
+    show_properties = False
     data = [
-        ["Name", "Mix Rate (per 100 gal)", "Warnings", "Description"]
+        ["Name", "Mix Rate (per 100 gal)", "Warnings", "Description", "Properties"]
     ]
 
     # Add chemical data
-    for chem in chemicals:
-        row = [
-            Paragraph(chem[0], styleN),
-            Paragraph(chem[1], styleN),
-            Paragraph(chem[2], styleN),
-            Paragraph(chem[3], styleN)
-        ]
-        data.append(row)
+    count = 0
+    for chem in reports.fetch_chemicals(conn, filters):
+        if not count:
+            print("\nCurrent Chemicals:")
+        print_chemical(chem)
+        count += 1
+        properties = None
+        if chem['mol_weight'] is not None:
+            show_properties = True
+            properties = Paragraph(descriptors.format_descriptors(
+                chem['mol_weight'], chem['logp'], chem['hazard_flags']), styleN)
+        data.append([
+            Paragraph(chem['name'], styleN),
+            Paragraph(chem['mix_rate'], styleN),
+            Paragraph(chem['warnings'], styleN),
+            Paragraph(chem['description'], styleN),
+            properties
+        ])
+    if not count:
+        print("No chemicals in the database.")
+    if not show_properties:
+        for row in data:
+            row.pop()
 
     # Table style
-    table = Table(data, colWidths=[100, 100, 120, 170])
+    col_widths = [100, 100, 110, 130, 100] if show_properties else [100, 100, 120, 170]
+    table = Table(data, colWidths=col_widths)
     table.setStyle(TableStyle([
         ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
         ('TEXTCOLOR',(0,0),(-1,0),colors.black),
@@ -298,10 +323,15 @@ def main():
 
         if choice == "1":
             name = input("Enter chemical name: ")
-            mix_rate = input("Enter mix rate (amount per 100 gallons, e.g., 2 oz): ")
+            mix_rate = input("Enter mix rate (amount per 100 gallons, e.g., 2 fl oz or 2 oz wt): ")
             warnings = input("Enter warnings: ")
             description = input("Enter description: ")
-            add_chemical(cursor, name, f"{mix_rate} per 100 gal", warnings, description)
+            smiles = input("Enter SMILES structure (optional): ").strip()
+            if smiles:
+                smiles = descriptors.cache_descriptors(conn, [smiles]).get(smiles)
+                if smiles is None:
+                    print("Invalid SMILES, adding the chemical without a structure.")
+            add_chemical(cursor, name, f"{mix_rate} per 100 gal", warnings, description, smiles or None)
             conn.commit()
 
         elif choice == "2":
@@ -340,14 +370,29 @@ def main():
                 "address": company_address
             }
 
-            generate_pdf(
-                db_name,
-                output_pdf,
-                company_info,
-                subcontractor,
-                title=custom_title or "Squirrel TEcH LLC Chemical Inventory",
-                logo_path=logo_path
-            )
+            # Optional filters, e.g. only the chemicals one truck used last week
+            filters = {}
+            if input("Limit to one chemical, or to chemicals used by a truck, tank or date range? (y/n): ").lower() == 'y':
+                filters = {
+                    'chemical': input("Chemical name (leave blank for all): ").strip(),
+                    'truck': input("Truck name (leave blank for all): ").strip(),
+                    'tank': input("Tank name (leave blank for all): ").strip(),
+                    'start': input("From date YYYY-MM-DD (leave blank for no limit): ").strip(),
+                    'end': input("To date YYYY-MM-DD (leave blank for no limit): ").strip(),
+                }
+
+            try:
+                generate_pdf(
+                    db_name,
+                    output_pdf,
+                    company_info,
+                    subcontractor,
+                    title=custom_title or "Squirrel TEcH LLC Chemical Inventory",
+                    logo_path=logo_path,
+                    filters=filters
+                )
+            except ValueError as e:
+                print(f"Error generating PDF: {e}")
 
 
             
@@ -0,0 +1,175 @@
+import contextlib
+import re
+import sqlite3
+
+import numpy as np
+
+# Every mix rate is stored as an amount per this many gallons of tank mix
+BASE_GALLONS = 100
+
+# Factors to the canonical unit of each kind: ounces by weight ('oz'), fluid ounces by volume
+WEIGHT_UNITS = {
+    'oz wt': 1.0, 'wt oz': 1.0, 'ounce wt': 1.0, 'ounces wt': 1.0,
+    'lb': 16.0, 'lbs': 16.0, 'pound': 16.0, 'pounds': 16.0,
+    'g': 0.035274, 'gram': 0.035274, 'grams': 0.035274,
+    'kg': 35.274, 'kilogram': 35.274, 'kilograms': 35.274,
+}
+VOLUME_UNITS = {
+    'fl oz': 1.0, 'floz': 1.0, 'fluid ounce': 1.0, 'fluid ounces': 1.0,
+    'tsp': 1 / 6, 'tbsp': 0.5, 'cup': 8.0, 'cups': 8.0,
+    'pt': 16.0, 'pint': 16.0, 'pints': 16.0,
+    'qt': 32.0, 'quart': 32.0, 'quarts': 32.0,
+    'gal': 128.0, 'gallon': 128.0, 'gallons': 128.0,
+    'ml': 0.033814, 'l': 33.814, 'liter': 33.814, 'liters': 33.814, 'litre': 33.814, 'litres': 33.814,
+}
+# A bare ounce may be a weight or a fluid ounce; rates using it are left unparsed
+AMBIGUOUS_UNITS = ('oz', 'ounce', 'ounces')
+# Tank volume units, in gallons
+PER_UNITS = {
+    'gal': 1.0, 'gallon': 1.0, 'gallons': 1.0,
+    'l': 0.264172, 'liter': 0.264172, 'liters': 0.264172, 'litre': 0.264172, 'litres': 0.264172,
+}
+
+NUMBER = r'\d+\s+\d+/\d+|\d+/\d+|\d*\.?\d+'  # 2, 1.5, .5, 1/2 or 1 1/2
+
+
+def _alternation(units):
+    """Build a regex alternation matching the longest unit names first."""
+    return '|'.join(re.escape(unit).replace(r'\ ', r'\s*') for unit in sorted(units, key=len, reverse=True))
+
+
+# First "<amount>[-<amount>] <unit> per [<n>] <volume unit>" in the text; labels
+# often add notes such as "(herbicide)" or "+ adjuvant" around it, and
+# an amount right after "per" or a dash is a tank size, never a product amount
+MIX_RATE_PATTERN = re.compile(
+    rf'(?<![\d.-])(?<!per )(?P<qty>{NUMBER})(?:\s*-\s*(?P<qty_high>{NUMBER}))?'
+    rf'\s*(?P<unit>{_alternation(list(WEIGHT_UNITS) + list(VOLUME_UNITS) + list(AMBIGUOUS_UNITS))})\b\.?'
+    rf'(?:\s*\([^)]*\))?\s*(?:per|/)\s*(?P<per>{NUMBER})?\s*(?P<per_unit>{_alternation(PER_UNITS)})\b'
+)
+
+
+def _parse_quantity(text):
+    """Parse a decimal, fraction or mixed-number quantity."""
+    whole, _, fraction = text.strip().rpartition(' ')
+    if '/' in fraction:
+        numerator, denominator = fraction.split('/')
+        value = float(numerator) / float(denominator)
+        return value + (float(whole) if whole else 0.0)
+    return float(text)
+
+
+def parse_mix_rate(mix_rate):
+    """Normalize free text like '2 fl oz per 100 gal' to (amount per 100 gal, unit), or (None, None).
+
+    Ranges such as '8-16 fl oz per 100 gallons' resolve to their upper bound
+    so load planning never brings too little product. Rates per acre or per
+    area are not tank rates and stay unparsed, as do rates in bare ounces:
+    write 'fl oz' or 'oz wt'.
+    """
+    if not mix_rate:
+        return None, None
+    text = ' '.join(mix_rate.lower().replace('\u2013', '-').replace('\u2014', '-').replace('fl.', 'fl').split())
+    match = MIX_RATE_PATTERN.search(text)
+    if not match:
+        return None, None
+
+    unit = ' '.join(match.group('unit').split())
+    if unit in AMBIGUOUS_UNITS:
+        return None, None
+    if unit in WEIGHT_UNITS:
+        factor, canonical_unit = WEIGHT_UNITS[unit], 'oz'
+    else:
+        factor, canonical_unit = VOLUME_UNITS[unit], 'fl oz'
+
+    try:
+        quantity = _parse_quantity(match.group('qty_high') or match.group('qty'))
+        per_gallons = _parse_quantity(match.group('per') or '1') * PER_UNITS[match.group('per_unit')]
+        if per_gallons <= 0:
+            return None, None
+    except (ValueError, ZeroDivisionError):
+        return None, None
+    return round(quantity * factor * BASE_GALLONS / per_gallons, 6), canonical_unit
+
+
+def ensure_mix_rate_columns(conn):
+    """Add the normalized mix rate columns to chemicals and fill them for existing rows."""
+    cursor = conn.cursor()
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(chemicals)')]
+    added = False
+    for column, column_type in (('mix_qty', 'REAL'), ('mix_unit', 'TEXT')):
+        if column not in columns:
+            # Another process upgrading at the same moment may add it first
+            with contextlib.suppress(sqlite3.OperationalError):
+                cursor.execute(f'ALTER TABLE chemicals ADD COLUMN {column} {column_type}')
+                added = True
+    # Before bare ounces were refused they were read as weight; parse those rates again
+    condition = 'mix_rate IS NOT NULL' if added else "mix_unit = 'oz'"
+    rows = cursor.execute(f'SELECT id, mix_rate FROM chemicals WHERE {condition}').fetchall()
+    cursor.executemany('UPDATE chemicals SET mix_qty = ?, mix_unit = ? WHERE id = ?',
+                       [(*parse_mix_rate(row[1]), row[0]) for row in rows])
+    conn.commit()
+
+
+def calculate_dosages(volumes, mix_qtys):
+    """Return the amount of each chemical needed for the given tank-mix volumes in gallons."""
+    volumes = np.asarray(volumes, dtype=float)
+    mix_qtys = np.asarray(mix_qtys, dtype=float)
+    return volumes * mix_qtys / BASE_GALLONS
+
+
+def build_load_plan(conn, mixes, top_up=False):
+    """Compute dosages for many tank mixes at once.
+
+    mixes is a list of (tank_id, [chemical names]) pairs. With top_up the
+    volume to mix is the tank's free space, otherwise its full capacity.
+    """
+    tank_ids = sorted({tank_id for tank_id, _ in mixes})
+    chemical_names = sorted({name for _, names in mixes for name in names})
+    if not tank_ids or not chemical_names:
+        return {'lines': [], 'totals': []}
+
+    tanks = conn.execute(f'''
+        SELECT id, tank_name, COALESCE(capacity, 0), current_level
+        FROM tanks WHERE id IN ({','.join('?' * len(tank_ids))})
+    ''', tank_ids).fetchall()
+    chemicals = conn.execute(f'''
+        SELECT name, mix_qty, mix_unit
+        FROM chemicals WHERE name IN ({','.join('?' * len(chemical_names))})
+    ''', chemical_names).fetchall()
+
+    tank_index = {row[0]: i for i, row in enumerate(tanks)}
+    chemical_index = {row[0]: i for i, row in enumerate(chemicals)}
+    capacities = np.array([row[2] for row in tanks], dtype=float)
+    levels = np.array([row[3] or 0 for row in tanks], dtype=float)
+    volumes = np.clip(capacities - levels, 0, None) if top_up else capacities
+    rates = np.array([np.nan if row[1] is None else row[1] for row in chemicals], dtype=float)
+
+    # One entry per tank/chemical combination, skipping unknown tanks and chemicals
+    pairs = [(tank_index[tank_id], chemical_index[name])
+             for tank_id, names in mixes if tank_id in tank_index
+             for name in names if name in chemical_index]
+    if not pairs:
+        return {'lines': [], 'totals': []}
+    pair_tanks, pair_chemicals = np.array(pairs, dtype=np.intp).T
+
+    amounts = calculate_dosages(volumes[pair_tanks], rates[pair_chemicals])
+    known = ~np.isnan(amounts)
+    totals = np.bincount(pair_chemicals[known], weights=amounts[known], minlength=len(chemicals))
+
+    lines = [
+        {
+            'tank_id': tanks[t][0],
+            'tank_name': tanks[t][1],
+            'volume': float(volumes[t]),
+            'chemical_name': chemicals[c][0],
+            'amount': round(float(amount), 3) if ok else None,
+            'unit': chemicals[c][2],
+        }
+        for t, c, amount, ok in zip(pair_tanks.tolist(), pair_chemicals.tolist(), amounts.tolist(), known.tolist(), strict=True)
+    ]
+    used = np.unique(pair_chemicals)
+    totals = [
+        {'chemical_name': chemicals[c][0], 'amount': round(float(totals[c]), 3), 'unit': chemicals[c][2]}
+        for c in used.tolist()
+    ]
+    return {'lines': lines, 'totals': totals}
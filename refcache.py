@@ -0,0 +1,89 @@
+import threading
+from collections import namedtuple
+
+# Rows shaped like the sqlite3.Row results the forms used to get, but immutable and small
+ChemicalRef = namedtuple('ChemicalRef', ['id', 'name'])
+TankRef = namedtuple('TankRef', ['id', 'tank_name'])
+
+REFERENCE_TABLES = {
+    'chemicals': 'name',
+    'tanks': 'tank_name',
+}
+
+
+class ReferenceData:
+    """One consistent snapshot of the pick lists and their name -> id maps."""
+
+    __slots__ = ('version', 'chemicals', 'tanks', 'chemical_ids', 'tank_ids')
+
+    def __init__(self, version, chemicals, tanks):
+        self.version = version
+        self.chemicals = chemicals
+        self.tanks = tanks
+        # Chemical names are not unique; the first id in name order wins
+        self.chemical_ids = {}
+        for chem in chemicals:
+            self.chemical_ids.setdefault(chem.name, chem.id)
+        self.tank_ids = {tank.tank_name: tank.id for tank in tanks}
+
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def ensure_reference_versions(conn):
+    """Create the version counters and the triggers that bump them on name changes."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reference_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    for table, name_column in REFERENCE_TABLES.items():
+        cursor.execute('INSERT OR IGNORE INTO reference_versions (table_name, version) VALUES (?, 0)', (table,))
+        # Level and other column updates leave the pick lists alone
+        for event in ('INSERT', 'DELETE', f'UPDATE OF {name_column}'):
+            trigger = f"refcache_{table}_{event.split()[0].lower()}"
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {trigger}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE reference_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            ''')
+    conn.commit()
+
+
+def _current_version(conn):
+    """Read the combined version of the reference tables."""
+    return tuple(row[0] for row in conn.execute('SELECT version FROM reference_versions ORDER BY table_name'))
+
+
+def reference_data(conn, db_name):
+    """Return the cached pick lists for a database, reloading them if the tables changed."""
+    version = _current_version(conn)
+    cached = _cache.get(db_name)
+    if cached is not None and cached.version == version:
+        return cached
+
+    with _lock:
+        cached = _cache.get(db_name)
+        if cached is not None and cached.version == version:
+            return cached
+        chemicals = tuple(ChemicalRef(*row) for row in
+                          conn.execute('SELECT id, name FROM chemicals ORDER BY name').fetchall())
+        tanks = tuple(TankRef(*row) for row in
+                      conn.execute('SELECT id, tank_name FROM tanks ORDER BY tank_name').fetchall())
+        cached = ReferenceData(version, chemicals, tanks)
+        _cache[db_name] = cached
+        return cached
+
+
+def invalidate(db_name=None):
+    """Drop the cached lists for one database, or all of them, after a known change."""
+    with _lock:
+        if db_name is None:
+            _cache.clear()
+        else:
+            _cache.pop(db_name, None)
@@ -0,0 +1,112 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import changefeed
+import sqlprofile
+import textstore
+
+# 'replica' runs reports against a snapshot copy of the database; 'live' reads the database itself
+REPORTING_MODE = os.environ.get('NUTTALLX_REPORTING', 'replica')
+# Staleness bound: a replica behind the database is refreshed once it is older than this
+MAX_AGE_SECONDS = float(os.environ.get('NUTTALLX_REPLICA_MAX_AGE', '60'))
+
+_refresh_lock = threading.Lock()
+
+
+def replica_path(db_name):
+    """Return the snapshot file used for reporting reads on a database."""
+    return f"{db_name}.replica"
+
+
+def refresh(db_name):
+    """Copy the database into its replica with the backup API and return the replica path."""
+    path = replica_path(db_name)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    source = sqlite3.connect(db_name)
+    target = sqlite3.connect(temp_path)
+    try:
+        # One step, so writes landing mid-copy cannot restart it. The apps put every database in
+        # WAL mode (schema.ensure_schema), where this read never blocks them either.
+        source.backup(target)
+        # Immutable readers must not look for a -wal file
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+    # Connections already open keep reading the file they opened
+    os.replace(temp_path, path)
+    return path
+
+
+def age(db_name):
+    """Return how many seconds ago the replica was written, or None if there is none."""
+    try:
+        return time.time() - os.path.getmtime(replica_path(db_name))
+    except OSError:
+        return None
+
+
+def _behind(db_name):
+    """True if the database has changes the replica does not."""
+    try:
+        live = sqlite3.connect(db_name)
+        snapshot = sqlite3.connect(f"file:{replica_path(db_name)}?mode=ro&immutable=1", uri=True)
+        try:
+            return changefeed.latest_seq(live) != changefeed.latest_seq(snapshot)
+        finally:
+            snapshot.close()
+            live.close()
+    except sqlite3.OperationalError:
+        # No change log to compare with; fall back on age alone
+        return True
+
+
+def ensure_fresh(db_name, max_age=MAX_AGE_SECONDS):
+    """Refresh the replica if it is missing, or older than max_age and behind the database."""
+    current_age = age(db_name)
+    if current_age is not None and (current_age <= max_age or not _behind(db_name)):
+        return False
+    with _refresh_lock:
+        # Another thread may have refreshed it while this one waited
+        current_age = age(db_name)
+        if current_age is not None and current_age <= max_age:
+            return False
+        refresh(db_name)
+    return True
+
+
+def connect(db_name, max_age=MAX_AGE_SECONDS):
+    """Open a read-only connection for reporting queries, on the replica unless reporting is live."""
+    if REPORTING_MODE == 'replica':
+        try:
+            ensure_fresh(db_name, max_age)
+            conn = sqlprofile.connect(f"file:{replica_path(db_name)}?mode=ro&immutable=1", uri=True)
+        except sqlite3.Error as e:
+            print(f"Reporting replica unavailable, reading the live database: {e}")
+            conn = sqlprofile.connect(db_name)
+    else:
+        conn = sqlprofile.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    textstore.register(conn)
+    return conn
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Refresh or inspect the read-only reporting replica.')
+    parser.add_argument('db_name', nargs='?', default='AECD.db')
+    parser.add_argument('--status', action='store_true', help='show the replica age without refreshing')
+    args = parser.parse_args()
+
+    if not args.status:
+        started = time.perf_counter()
+        refresh(args.db_name)
+        print(f"Refreshed {replica_path(args.db_name)} in {time.perf_counter() - started:.2f}s.")
+    replica_age = age(args.db_name)
+    if replica_age is None:
+        print("No replica yet.")
+    else:
+        print(f"Replica is {replica_age:.0f}s old"
+              f"{' and behind the database' if _behind(args.db_name) else ' and up to date'}.")
@@ -0,0 +1,333 @@
+import contextlib
+import io
+import sqlite3
+from datetime import datetime
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+import descriptors
+import rowstream
+import textstore
+
+# Select lists with the interned free-text fields decoded under their usual names;
+# each needs its *_TEXT_JOINS after the FROM clause
+CHEMICAL_COLUMNS = ("c.id, c.name, c.mix_rate, c.mix_qty, c.mix_unit, c.smiles, "
+                    f"{textstore.joined('warnings', 'c')} AS warnings, "
+                    f"{textstore.joined('description', 'c')} AS description")
+CHEMICAL_TEXT_JOINS = f"{textstore.text_join('warnings', 'c')} {textstore.text_join('description', 'c')}"
+LOG_COLUMNS = ("u.id, u.chemical_name, u.tank_name, u.amount_used, u.date_logged, "
+               f"{textstore.joined('notes', 'u')} AS notes")
+LOG_TEXT_JOINS = textstore.text_join('notes', 'u')
+
+
+# The fetch functions return lazy rowstream.RowStream results; the builders below
+# consume them in one pass and return PDF bytes, so they can also run in a worker
+# process (which receives the rows as a list) without touching the database or Flask.
+
+
+# Report filters: each is optional and is applied in SQL where an index can serve it
+FILTER_NAMES = ('truck', 'tank', 'chemical', 'start', 'end')
+
+
+def normalize_filters(filters):
+    """Drop blank filters and check the dates; raises ValueError for a bad date."""
+    filters = {name: str(value).strip() for name, value in (filters or {}).items()
+               if name in FILTER_NAMES and value and str(value).strip()}
+    for name in ('start', 'end'):
+        if name in filters:
+            try:
+                filters[name] = datetime.strptime(filters[name], '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f"'{name}' must be a date like 2024-05-31") from None
+    return filters
+
+
+def ensure_report_indexes(conn):
+    """Create the indexes that filtered reports rely on."""
+    for sql in ('CREATE INDEX IF NOT EXISTS idx_usage_log_tank_date ON usage_log (tank_name, date_logged)',
+                'CREATE INDEX IF NOT EXISTS idx_tanks_truck ON tanks (truck_id)'):
+        # The table may not exist yet (console-only database)
+        with contextlib.suppress(sqlite3.OperationalError):
+            conn.execute(sql)
+    conn.commit()
+
+
+def log_filter_sql(filters, alias='u'):
+    """Build a WHERE clause and parameters selecting usage logs by truck, tank, chemical and dates.
+
+    start and end are inclusive 'YYYY-MM-DD' dates; chemical matches one name
+    within the comma-separated chemical_name of combined entries.
+    """
+    clauses = []
+    params = []
+    if filters.get('start'):
+        clauses.append(f"{alias}.date_logged >= ?")
+        params.append(filters['start'])
+    if filters.get('end'):
+        clauses.append(f"{alias}.date_logged < date(?, '+1 day')")
+        params.append(filters['end'])
+    if filters.get('tank'):
+        clauses.append(f"{alias}.tank_name = ?")
+        params.append(filters['tank'])
+    if filters.get('truck'):
+        clauses.append(f'''{alias}.tank_name IN (
+            SELECT t.tank_name FROM tanks t JOIN trucks tr ON tr.id = t.truck_id WHERE tr.truck_name = ?)''')
+        params.append(filters['truck'])
+    if filters.get('chemical'):
+        clauses.append(f"instr(', ' || {alias}.chemical_name || ',', ', ' || ? || ',') > 0")
+        params.append(filters['chemical'])
+    return ' AND '.join(clauses) or '1', params
+
+
+def describe_filters(filters):
+    """Summarize active filters for a report title, e.g. 'truck Blue, 2024-05-01 to 2024-05-07'."""
+    parts = [f"{name} {filters[name]}" for name in ('truck', 'tank', 'chemical') if filters.get(name)]
+    if filters.get('start') or filters.get('end'):
+        parts.append(f"{filters.get('start') or '...'} to {filters.get('end') or '...'}")
+    return ', '.join(parts)
+
+
+def fetch_chemicals(conn, filters=None):
+    """Read the rows for the chemical inventory report.
+
+    A chemical filter keeps that chemical; truck, tank and date filters keep the
+    chemicals logged for those tanks in that period.
+    """
+    filters = filters or {}
+    clauses = []
+    params = []
+    if filters.get('chemical'):
+        clauses.append('c.name = ?')
+        params.append(filters['chemical'])
+    usage_filters = {name: filters.get(name) for name in ('truck', 'tank', 'start', 'end')}
+    if any(usage_filters.values()):
+        usage_sql, usage_params = log_filter_sql(usage_filters)
+        clauses.append(f'''EXISTS (
+            SELECT 1 FROM usage_log u
+            WHERE {usage_sql} AND instr(', ' || u.chemical_name || ',', ', ' || c.name || ',') > 0)''')
+        params.extend(usage_params)
+
+    return rowstream.stream(conn, f'''
+        SELECT {CHEMICAL_COLUMNS}, d.mol_weight, d.logp, d.hazard_flags
+        FROM chemicals c {CHEMICAL_TEXT_JOINS}
+        LEFT JOIN chemical_descriptors d ON d.canonical_smiles = c.smiles
+        WHERE {' AND '.join(clauses) or '1'}
+        ORDER BY c.name
+    ''', params)
+
+
+def fetch_tanks(conn, filters=None):
+    """Read the rows for the tank inventory report, optionally for one truck or tank."""
+    filters = filters or {}
+    clauses = []
+    params = []
+    if filters.get('tank'):
+        clauses.append('t.tank_name = ?')
+        params.append(filters['tank'])
+    if filters.get('truck'):
+        clauses.append('t.truck_id = (SELECT id FROM trucks WHERE truck_name = ?)')
+        params.append(filters['truck'])
+    return rowstream.stream(conn, f'''
+        SELECT t.* FROM tanks t
+        WHERE {' AND '.join(clauses) or '1'}
+        ORDER BY t.tank_name
+    ''', params)
+
+
+def fetch_logs(conn, filters=None):
+    """Read the rows for the usage logs report, newest first."""
+    where, params = log_filter_sql(filters or {})
+    return rowstream.stream(conn, f'''
+        SELECT {LOG_COLUMNS} FROM usage_log u {LOG_TEXT_JOINS}
+        WHERE {where}
+        ORDER BY u.date_logged DESC
+    ''', params)
+
+
+def table_style(header_font_size=12):
+    """Return the grid style shared by all web reports."""
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), header_font_size),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+
+
+def _build(title, add_body):
+    """Lay out a titled, dated report and return it as PDF bytes."""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter,
+                            rightMargin=30, leftMargin=30,
+                            topMargin=30, bottomMargin=30)
+
+    elements = []
+    styles = getSampleStyleSheet()
+
+    elements.append(Paragraph(title, styles['Title']))
+    elements.append(Spacer(1, 12))
+
+    date_p = Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal'])
+    elements.append(date_p)
+    elements.append(Spacer(1, 24))
+
+    add_body(elements, styles)
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def build_chemicals_pdf(chemicals, title="NUTtall X - Chemical Inventory Report"):
+    """Build the chemical inventory report."""
+    def add_body(elements, styles):
+        if not chemicals:
+            elements.append(Paragraph("No chemicals found.", styles['Normal']))
+            return
+
+        # Table data, with a properties column when any structures are known;
+        # the rows are read once, so the column is dropped afterwards if unused
+        show_properties = False
+        data = [['Name', 'Mix Rate', 'Warnings', 'Description', 'Properties']]
+        for chem in chemicals:
+            properties = None
+            if chem.get('mol_weight') is not None:
+                show_properties = True
+                properties = Paragraph(descriptors.format_descriptors(
+                    chem['mol_weight'], chem['logp'], chem['hazard_flags']), styles['Normal'])
+            data.append([
+                Paragraph(chem['name'], styles['Normal']),
+                Paragraph(chem['mix_rate'] or '-', styles['Normal']),
+                Paragraph(chem['warnings'] or '-', styles['Normal']),
+                Paragraph(chem['description'] or '-', styles['Normal']),
+                properties
+            ])
+        if not show_properties:
+            for row in data:
+                row.pop()
+
+        if show_properties:
+            col_widths = [1.4*inch, 1.3*inch, 1.6*inch, 1.9*inch, 1.3*inch]
+        else:
+            col_widths = [1.5*inch, 1.5*inch, 2*inch, 2.5*inch]
+        table = Table(data, colWidths=col_widths)
+        table.setStyle(table_style())
+        elements.append(table)
+
+    return _build(title, add_body)
+
+
+def build_tanks_pdf(tanks, title="NUTtall X - Tank Inventory Report"):
+    """Build the tank inventory report."""
+    def add_body(elements, styles):
+        if not tanks:
+            elements.append(Paragraph("No tanks found.", styles['Normal']))
+            return
+
+        data = [['Tank Name', 'Capacity', 'Location']]
+        for tank in tanks:
+            data.append([
+                tank['tank_name'],
+                str(tank['capacity']) if tank['capacity'] else '-',
+                tank['location'] or '-'
+            ])
+
+        table = Table(data, colWidths=[2*inch, 2*inch, 3*inch])
+        table.setStyle(table_style())
+        elements.append(table)
+
+    return _build(title, add_body)
+
+
+def build_logs_pdf(logs, title="NUTtall X - Usage Logs Report"):
+    """Build the usage logs report."""
+    def add_body(elements, styles):
+        if not logs:
+            elements.append(Paragraph("No usage logs found.", styles['Normal']))
+            return
+
+        data = [['Date', 'Chemical', 'Tank', 'Amount', 'Notes']]
+        for log in logs:
+            data.append([
+                Paragraph(log['date_logged'], styles['Normal']),
+                Paragraph(log['chemical_name'], styles['Normal']),
+                Paragraph(log['tank_name'], styles['Normal']),
+                Paragraph(str(log['amount_used']), styles['Normal']),
+                Paragraph(log['notes'] or '-', styles['Normal'])
+            ])
+
+        table = Table(data, colWidths=[1.5*inch, 1.5*inch, 1.5*inch, 1*inch, 2*inch])
+        table.setStyle(table_style(header_font_size=10))
+        elements.append(table)
+
+    return _build(title, add_body)
+
+
+def build_compliance_pdf(rows, title="NUTtall X - Compliance Summary"):
+    """Build the per-period applied chemical totals from compliance.summarize."""
+    def add_body(elements, styles):
+        if not rows:
+            elements.append(Paragraph("No chemical usage in this range.", styles['Normal']))
+            return
+
+        data = [['Period', 'Chemical', 'Mix Applied (gal)', 'Entries', 'Product Applied']]
+        for row in rows:
+            amount = (f"{row['product_amount']} {row['product_unit']}"
+                      if row['product_amount'] is not None else 'Unknown mix rate')
+            period = row['period'] if row['closed'] else f"{row['period']} (open)"
+            data.append([
+                Paragraph(period, styles['Normal']),
+                Paragraph(row['chemical_name'], styles['Normal']),
+                Paragraph(str(row['mix_gallons']), styles['Normal']),
+                Paragraph(str(row['entry_count']), styles['Normal']),
+                Paragraph(amount, styles['Normal'])
+            ])
+        table = Table(data, colWidths=[1.25*inch, 2.25*inch, 1.25*inch, 0.75*inch, 2*inch])
+        table.setStyle(table_style(header_font_size=10))
+        elements.append(table)
+        elements.append(Spacer(1, 12))
+        elements.append(Paragraph("Periods marked open are totalled from the current logs and may still change; "
+                                  "closed periods are final.", styles['Normal']))
+
+    return _build(title, add_body)
+
+
+def build_load_plan_pdf(plan):
+    """Build the load plan report from a mixrate.build_load_plan result."""
+    def add_body(elements, styles):
+        if not plan['lines']:
+            elements.append(Paragraph("No tank mixes selected.", styles['Normal']))
+            return
+
+        data = [['Tank', 'Mix Volume (gal)', 'Chemical', 'Amount']]
+        for line in plan['lines']:
+            amount = f"{line['amount']} {line['unit']}" if line['amount'] is not None else 'Unknown mix rate'
+            data.append([
+                Paragraph(line['tank_name'], styles['Normal']),
+                Paragraph(str(line['volume']), styles['Normal']),
+                Paragraph(line['chemical_name'], styles['Normal']),
+                Paragraph(amount, styles['Normal'])
+            ])
+        table = Table(data, colWidths=[2*inch, 1.25*inch, 2.25*inch, 1.75*inch])
+        table.setStyle(table_style(header_font_size=10))
+        elements.append(table)
+        elements.append(Spacer(1, 24))
+
+        elements.append(Paragraph("Totals to Load", styles['Heading2']))
+        data = [['Chemical', 'Total Amount']]
+        for total in plan['totals']:
+            data.append([
+                Paragraph(total['chemical_name'], styles['Normal']),
+                Paragraph(f"{total['amount']} {total['unit'] or ''}", styles['Normal'])
+            ])
+        table = Table(data, colWidths=[4*inch, 3*inch])
+        table.setStyle(table_style(header_font_size=10))
+        elements.append(table)
+
+    return _build("NUTtall X - Load Plan Report", add_body)
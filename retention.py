@@ -0,0 +1,302 @@
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import changefeed
+import textstore
+
+# Logs older than this many days are moved out of the hot usage_log table (0 disables archival)
+RETENTION_DAYS = int(os.environ.get('NUTTALLX_LOG_RETENTION_DAYS', '0'))
+ARCHIVE_DIR = os.environ.get('NUTTALLX_ARCHIVE_DIR', 'archives')
+ARCHIVE_FORMAT = os.environ.get('NUTTALLX_ARCHIVE_FORMAT', 'sqlite')  # 'sqlite' or 'ndjson'
+MAINTENANCE_INTERVAL_HOURS = float(os.environ.get('NUTTALLX_MAINTENANCE_INTERVAL_HOURS', '24'))
+VACUUM_PAGES = 2000
+
+ARCHIVE_COLUMNS = ('id', 'chemical_name', 'tank_name', 'amount_used', 'date_logged', 'notes')
+
+
+def ensure_retention_tables(conn):
+    """Create the tables and indexes used by log retention."""
+    cursor = conn.cursor()
+
+    # Pre-aggregated totals of archived rows, one row per month/chemical/tank
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS usage_log_archive_totals (
+            period TEXT NOT NULL,
+            chemical_name TEXT NOT NULL,
+            tank_name TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            entry_count INTEGER NOT NULL,
+            PRIMARY KEY (period, chemical_name, tank_name)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+    # Used both for finding archivable rows and for the newest-first log views
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_usage_log_date ON usage_log (date_logged)')
+    conn.commit()
+
+
+def archive_path(year, archive_dir=ARCHIVE_DIR, fmt=ARCHIVE_FORMAT):
+    """Return the archive file path for a given year."""
+    if fmt == 'ndjson':
+        return os.path.join(archive_dir, f"usage_log_{year}.ndjson.gz")
+    return os.path.join(archive_dir, f"usage_log_{year}.db")
+
+
+def list_archive_years(archive_dir=ARCHIVE_DIR):
+    """List the years that have archived usage logs, newest first."""
+    if not os.path.isdir(archive_dir):
+        return []
+    years = set()
+    for filename in os.listdir(archive_dir):
+        if filename.startswith('usage_log_') and filename.endswith(('.db', '.ndjson.gz')):
+            year = filename[len('usage_log_'):].split('.', 1)[0]
+            if year.isdigit():
+                years.add(year)
+    return sorted(years, reverse=True)
+
+
+def _add_archive_totals(conn, start, end):
+    """Fold the rows in [start, end) into the archived totals."""
+    conn.execute('''
+        INSERT INTO usage_log_archive_totals (period, chemical_name, tank_name, total_amount, entry_count)
+        SELECT substr(date_logged, 1, 7), chemical_name, tank_name, SUM(amount_used), COUNT(*)
+        FROM usage_log
+        WHERE date_logged >= ? AND date_logged < ?
+        GROUP BY substr(date_logged, 1, 7), chemical_name, tank_name
+        ON CONFLICT (period, chemical_name, tank_name) DO UPDATE SET
+            total_amount = total_amount + excluded.total_amount,
+            entry_count = entry_count + excluded.entry_count
+    ''', (start, end))
+
+
+def _archive_year_sqlite(conn, year, start, end, archive_dir):
+    """Move one year's rows into its archive database."""
+    conn.commit()
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_path(year, archive_dir, 'sqlite'),))
+    try:
+        # Take the write lock before reading, so another process archiving the same year
+        # waits and then finds the rows already moved
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive.usage_log (
+                id INTEGER PRIMARY KEY,
+                chemical_name TEXT NOT NULL,
+                tank_name TEXT NOT NULL,
+                amount_used REAL NOT NULL,
+                date_logged TEXT NOT NULL,
+                notes TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS archive.idx_usage_log_date ON usage_log (date_logged)')
+        # Archives keep the notes as plain text so they stay readable on their own
+        cursor = conn.execute(f'''
+            INSERT OR IGNORE INTO archive.usage_log (id, chemical_name, tank_name, amount_used, date_logged, notes)
+            SELECT u.id, u.chemical_name, u.tank_name, u.amount_used, u.date_logged, {textstore.joined('notes', 'u')}
+            FROM main.usage_log u {textstore.text_join('notes', 'u')}
+            WHERE u.date_logged >= ? AND u.date_logged < ?
+        ''', (start, end))
+        moved = cursor.rowcount
+        _add_archive_totals(conn, start, end)
+        conn.execute('DELETE FROM main.usage_log WHERE date_logged >= ? AND date_logged < ?', (start, end))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('DETACH DATABASE archive')
+    return moved
+
+
+def _archive_year_ndjson(conn, year, start, end, archive_dir):
+    """Append one year's rows to its compressed NDJSON archive."""
+    # The write lock is held from the read until the rows are deleted, so no other
+    # process appends the same rows, or anything at all, to the file meanwhile
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute(f'''
+            SELECT u.id, u.chemical_name, u.tank_name, u.amount_used, u.date_logged, {textstore.joined('notes', 'u')}
+            FROM usage_log u {textstore.text_join('notes', 'u')}
+            WHERE u.date_logged >= ? AND u.date_logged < ?
+            ORDER BY u.id
+        ''', (start, end)).fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+
+        # Each run appends a new gzip member; readers see them as one stream
+        with gzip.open(archive_path(year, archive_dir, 'ndjson'), 'at', encoding='utf-8') as file:
+            for row in rows:
+                file.write(json.dumps(dict(zip(ARCHIVE_COLUMNS, tuple(row), strict=True))) + '\n')
+        _add_archive_totals(conn, start, end)
+        conn.execute('DELETE FROM usage_log WHERE date_logged >= ? AND date_logged < ?', (start, end))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(rows)
+
+
+def archive_usage_logs(conn, retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, fmt=ARCHIVE_FORMAT):
+    """Move usage logs older than retention_days into per-year archives."""
+    if retention_days <= 0:
+        return 0
+    if fmt not in ('sqlite', 'ndjson'):
+        raise ValueError(f"Unknown archive format '{fmt}'")
+
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+    years = [row[0] for row in conn.execute('''
+        SELECT DISTINCT substr(date_logged, 1, 4)
+        FROM usage_log
+        WHERE date_logged < ?
+    ''', (cutoff,)).fetchall()]
+
+    archived = 0
+    for year in sorted(years):
+        start = f"{year}-01-01"
+        end = min(cutoff, f"{int(year) + 1}-01-01")
+        if fmt == 'ndjson':
+            archived += _archive_year_ndjson(conn, year, start, end, archive_dir)
+        else:
+            archived += _archive_year_sqlite(conn, year, start, end, archive_dir)
+    return archived
+
+
+def fetch_archived_logs(year, archive_dir=ARCHIVE_DIR):
+    """Read one year's archived usage logs, newest first."""
+    db_path = archive_path(year, archive_dir, 'sqlite')
+    ndjson_path = archive_path(year, archive_dir, 'ndjson')
+    logs = {}
+
+    if os.path.exists(db_path):
+        archive_conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            for row in archive_conn.execute('SELECT id, chemical_name, tank_name, amount_used, date_logged, notes FROM usage_log'):
+                logs[row[0]] = dict(zip(ARCHIVE_COLUMNS, row, strict=True))
+        finally:
+            archive_conn.close()
+
+    if os.path.exists(ndjson_path):
+        with gzip.open(ndjson_path, 'rt', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    entry = json.loads(line)
+                    logs[entry['id']] = entry
+
+    return sorted(logs.values(), key=lambda log: log['date_logged'], reverse=True)
+
+
+def archived_totals(conn, period_prefix=''):
+    """Return the pre-aggregated totals of archived logs, optionally for one year or month."""
+    return conn.execute('''
+        SELECT period, chemical_name, tank_name, total_amount, entry_count
+        FROM usage_log_archive_totals
+        WHERE period LIKE ?
+        ORDER BY period, chemical_name, tank_name
+    ''', (f"{period_prefix}%",)).fetchall()
+
+
+def enable_incremental_vacuum(conn):
+    """Switch the database to incremental auto-vacuum; returns False if it already was.
+
+    The switch only takes effect after a full VACUUM, which rewrites the whole
+    file and blocks every writer meanwhile, so this is a one-time offline step
+    run from the command line, never from the background maintenance job.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return False
+    conn.commit()
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+
+def run_maintenance(conn):
+    """Reclaim free pages and refresh the query planner statistics."""
+    # Databases not yet switched with enable_incremental_vacuum() keep their free pages
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        conn.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES})').fetchall()
+    conn.execute('PRAGMA optimize')
+    conn.execute('''
+        INSERT INTO maintenance_state (key, value) VALUES ('last_maintenance', ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+    ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+    conn.commit()
+
+
+def maintenance_due(conn, interval_hours=MAINTENANCE_INTERVAL_HOURS):
+    """Check whether the scheduled maintenance interval has elapsed."""
+    row = conn.execute("SELECT value FROM maintenance_state WHERE key = 'last_maintenance'").fetchone()
+    if not row:
+        return True
+    last_run = datetime.strptime(row[0], '%Y-%m-%d %H:%M:%S')
+    return datetime.now() - last_run >= timedelta(hours=interval_hours)
+
+
+def claim_retention_run(conn, interval_seconds, now=None):
+    """Claim this interval's retention run; with several server processes only one wins."""
+    now = now or datetime.now()
+    conn.execute("INSERT OR IGNORE INTO maintenance_state (key, value) VALUES ('retention_next_run', '')")
+    due_at = conn.execute("SELECT value FROM maintenance_state WHERE key = 'retention_next_run'").fetchone()[0]
+    claimed = 0
+    if due_at <= now.strftime('%Y-%m-%d %H:%M:%S'):
+        claimed = conn.execute('''
+            UPDATE maintenance_state SET value = ? WHERE key = 'retention_next_run' AND value = ?
+        ''', ((now + timedelta(seconds=interval_seconds)).strftime('%Y-%m-%d %H:%M:%S'), due_at)).rowcount
+    conn.commit()
+    return bool(claimed)
+
+
+def run_retention_cycle(db_name, interval_seconds=3600):
+    """Archive old logs and run maintenance when due, unless another process claimed this interval."""
+    # Imported here because schema imports this module for ensure_retention_tables
+    import schema
+    conn = sqlite3.connect(db_name)
+    try:
+        schema.ensure_schema(conn)
+        if not claim_retention_run(conn, interval_seconds):
+            return 0
+        archived = archive_usage_logs(conn)
+        if archived or maintenance_due(conn):
+            changefeed.compact_change_log(conn)
+            textstore.prune(conn)
+            run_maintenance(conn)
+        return archived
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive old usage logs and compact the database.')
+    parser.add_argument('db_name', nargs='?', default='AECD.db')
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS or 365,
+                        help='archive logs older than this many days')
+    parser.add_argument('--format', choices=['sqlite', 'ndjson'], default=ARCHIVE_FORMAT)
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='one-time full VACUUM so later maintenance can reclaim space incrementally; '
+                             'stop the apps first')
+    args = parser.parse_args()
+
+    import schema
+    conn = sqlite3.connect(args.db_name)
+    schema.ensure_schema(conn)
+    if args.enable_incremental_vacuum:
+        print("Incremental vacuum enabled." if enable_incremental_vacuum(conn) else "Incremental vacuum already enabled.")
+    count = archive_usage_logs(conn, args.days, args.archive_dir, args.format)
+    print(f"Archived {count} usage log(s) older than {args.days} days.")
+    run_maintenance(conn)
+    print("Maintenance completed.")
+    conn.close()
@@ -0,0 +1,95 @@
+from collections import namedtuple
+
+# Rows fetched from SQLite per round trip
+ARRAYSIZE = 256
+
+_record_types = {}
+
+
+def record_type(columns):
+    """Return the record class for a column list, creating it on first use."""
+    columns = tuple(columns)
+    if columns not in _record_types:
+        positions = {}
+        for index, column in enumerate(columns):
+            positions.setdefault(column, index)
+
+        class Record(namedtuple('Record', columns, rename=True)):
+            """A row as a plain tuple that also reads like sqlite3.Row: rec.name, rec['name'] or rec[0]."""
+
+            __slots__ = ()
+
+            def __getitem__(self, key):
+                if isinstance(key, str):
+                    return tuple.__getitem__(self, positions[key])
+                return tuple.__getitem__(self, key)
+
+            def get(self, key, default=None):
+                index = positions.get(key)
+                return default if index is None else tuple.__getitem__(self, index)
+
+            def keys(self):
+                return list(columns)
+
+            def __reduce__(self):
+                # Rebuilt from the column list so records pickle into export processes
+                return _make_record, (columns, tuple(self))
+
+        _record_types[columns] = Record
+    return _record_types[columns]
+
+
+def _make_record(columns, values):
+    """Unpickle a record."""
+    return record_type(columns)._make(values)
+
+
+class RowStream:
+    """Lazily read a query's rows in batches of arraysize, yielding records. Can be iterated once."""
+
+    __slots__ = ('cursor', 'columns', 'record', '_peeked')
+
+    def __init__(self, cursor, arraysize=ARRAYSIZE):
+        cursor.arraysize = arraysize
+        self.cursor = cursor
+        self.columns = tuple(column[0] for column in cursor.description or ())
+        self.record = record_type(self.columns)
+        self._peeked = None
+
+    def _fetch(self):
+        if self.cursor is None:
+            return []
+        batch = self.cursor.fetchmany()
+        if not batch:
+            self.close()
+        return batch
+
+    def __bool__(self):
+        """True if any rows remain; reads ahead one batch to find out."""
+        if self._peeked is None:
+            self._peeked = self._fetch()
+        return bool(self._peeked)
+
+    def __iter__(self):
+        make = self.record._make
+        while True:
+            batch, self._peeked = (self._peeked if self._peeked is not None else self._fetch()), None
+            if not batch:
+                return
+            for row in batch:
+                yield make(row)
+
+    def close(self):
+        """Stop reading and release the cursor."""
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
+
+
+def stream(conn, sql, params=(), arraysize=ARRAYSIZE):
+    """Run a query and return a RowStream over its results."""
+    cursor = conn.cursor()
+    # Plain tuples from SQLite; the stream wraps them in its own records
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    return RowStream(cursor, arraysize)
@@ -0,0 +1,357 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import changefeed
+import compliance
+import replica
+import reports
+import retention
+import sqlprofile
+import workers
+
+# Pre-rendered reports land next to the other PDFs so they show up on the reports page
+REPORTS_DIR = os.environ.get('NUTTALLX_REPORTS_DIR', '.')
+POLL_SECONDS = 30
+RETENTION_INTERVAL_SECONDS = 3600
+
+# Report kinds: tables whose changes make a rendering stale, and how to render one.
+# With 'columns', only changes to those columns of the tables make it stale.
+REPORTS = {
+    'chemicals': {
+        'tables': ('chemicals',),
+        'render': lambda conn, _now: workers.run_export(reports.build_chemicals_pdf, reports.fetch_chemicals(conn)),
+    },
+    'tanks': {
+        'tables': ('tanks',),
+        # Every logged usage moves current_level, which the report does not show
+        'columns': ('tank_name', 'capacity', 'location'),
+        'render': lambda conn, _now: workers.run_export(reports.build_tanks_pdf, reports.fetch_tanks(conn)),
+    },
+    'logs': {
+        'tables': ('usage_log',),
+        'render': lambda conn, _now: workers.run_export(reports.build_logs_pdf, reports.fetch_logs(conn)),
+    },
+    # The previous calendar day only; written to a dated file and never served from the cache
+    'logs_yesterday': {
+        'tables': None,
+        'render': lambda conn, now: _render_yesterday(conn, now),
+    },
+}
+
+DEFAULT_SCHEDULES = [
+    ('morning_usage', 'logs_yesterday', '0 4 * * *'),
+    ('morning_chemicals', 'chemicals', '15 4 * * *'),
+]
+
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def _parse_cron_field(text, low, high):
+    """Parse one cron field (*, 5, 1-5, */15, 1,3,5) into a set of values."""
+    values = set()
+    for part in text.split(','):
+        span, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if span == '*':
+            start, end = low, high
+        elif '-' in span:
+            start, end = (int(value) for value in span.split('-', 1))
+        else:
+            start = int(span)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"Cron field '{text}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expr):
+    """Parse 'minute hour day-of-month month day-of-week' into value sets."""
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"Cron expression '{expr}' must have 5 fields")
+    minutes, hours, days, months, weekdays = (
+        _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS, strict=True)
+    )
+    # Sunday is both 0 and 7
+    weekdays = {day % 7 for day in weekdays}
+    return minutes, hours, days, months, weekdays, fields[2] == '*', fields[4] == '*'
+
+
+def _day_matches(cron, moment):
+    """Apply cron's rule that a restricted day-of-month or day-of-week is enough."""
+    _, _, days, _, weekdays, any_day, any_weekday = cron
+    day_ok = moment.day in days
+    weekday_ok = (moment.weekday() + 1) % 7 in weekdays
+    if any_day or any_weekday:
+        return day_ok and weekday_ok
+    return day_ok or weekday_ok
+
+
+def next_run(expr, after):
+    """Return the first minute after a datetime that matches a cron expression."""
+    cron = parse_cron(expr)
+    minutes, hours, _, months = cron[:4]
+    moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = after + timedelta(days=366 * 5)
+    while moment <= limit:
+        if moment.month not in months:
+            moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+        elif not _day_matches(cron, moment):
+            moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+        elif moment.hour not in hours:
+            moment = moment.replace(minute=0) + timedelta(hours=1)
+        elif moment.minute not in minutes:
+            moment += timedelta(minutes=1)
+        else:
+            return moment
+    raise ValueError(f"Cron expression '{expr}' never matches")
+
+
+def ensure_schedule_tables(conn):
+    """Create the schedule and report cache tables, seeding the default schedules once."""
+    cursor = conn.cursor()
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'report_schedules'").fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_schedules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            report TEXT NOT NULL,
+            cron TEXT NOT NULL,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            next_run TEXT NOT NULL,
+            last_run TEXT,
+            last_file TEXT,
+            last_error TEXT
+        )
+    ''')
+
+    # The newest pre-rendered copy of each report and the report_key() it reflects
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_cache (
+            report TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            rendered_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+
+    if not exists:
+        for name, report, cron in DEFAULT_SCHEDULES:
+            add_schedule(conn, name, report, cron)
+
+
+def add_schedule(conn, name, report, cron):
+    """Add or replace a schedule after validating its report kind and cron expression."""
+    if report not in REPORTS:
+        raise ValueError(f"Unknown report '{report}' (choose from {', '.join(REPORTS)})")
+    first_run = next_run(cron, datetime.now()).strftime('%Y-%m-%d %H:%M')
+    conn.execute('''
+        INSERT INTO report_schedules (name, report, cron, next_run) VALUES (?, ?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET report = excluded.report, cron = excluded.cron,
+            next_run = excluded.next_run, enabled = 1
+    ''', (name, report, cron, first_run))
+    conn.commit()
+
+
+def _render_yesterday(conn, now):
+    """Render the previous day's usage logs."""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    yesterday = today - timedelta(days=1)
+    day = yesterday.strftime('%Y-%m-%d')
+    logs = reports.fetch_logs(conn, {'start': day, 'end': day})
+    title = f"NUTtall X - Usage Logs Report {yesterday.strftime('%Y-%m-%d')}"
+    return workers.run_export(reports.build_logs_pdf, logs, title)
+
+
+def report_key(conn, report):
+    """Return what a cached rendering of a report is checked against.
+
+    The newest change to its tables, or for reports that list their columns,
+    a hash of those columns' values, so other updates leave the copy current.
+    """
+    spec = REPORTS[report]
+    if 'columns' not in spec:
+        return changefeed.table_seq(conn, spec['tables'])
+    digest = hashlib.blake2b(digest_size=8)
+    for table in spec['tables']:
+        for row in conn.execute(f"SELECT {', '.join(spec['columns'])} FROM {table} ORDER BY id"):
+            digest.update(repr(tuple(row)).encode('utf-8'))
+    # Fits the signed 64-bit seq column
+    return int.from_bytes(digest.digest(), 'big') >> 1
+
+
+def render_report(conn, name, report, now=None, reports_dir=REPORTS_DIR, source=None):
+    """Render one report into the reports directory and record it in the cache.
+
+    The rows are read from source (a reporting replica) when given, else from conn.
+    """
+    now = now or datetime.now()
+    spec = REPORTS[report]
+    source = source or conn
+    # Read the cache key first so a change made while rendering marks the copy stale;
+    # taken from the rows' own database, so a copy rendered from an older replica is stale too
+    seq = report_key(source, report) if spec['tables'] else None
+    pdf = spec['render'](source, now)
+
+    if report == 'logs_yesterday':
+        filename = f"{name}_{(now - timedelta(days=1)).strftime('%Y%m%d')}.pdf"
+    else:
+        filename = f"{name}.pdf"
+    path = os.path.join(reports_dir, filename)
+    # Write then rename so a download in progress never sees half a file
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(pdf)
+    os.replace(temp_path, path)
+
+    if seq is not None:
+        conn.execute('''
+            INSERT INTO report_cache (report, seq, path, rendered_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (report) DO UPDATE SET seq = excluded.seq, path = excluded.path,
+                rendered_at = excluded.rendered_at
+        ''', (report, seq, os.path.abspath(path), now.strftime('%Y-%m-%d %H:%M:%S')))
+        conn.commit()
+    return path
+
+
+def cached_report(conn, report):
+    """Return the path of a pre-rendered report if its report_key() is unchanged, else None."""
+    row = conn.execute('SELECT seq, path FROM report_cache WHERE report = ?', (report,)).fetchone()
+    if not row or not os.path.exists(row[1]):
+        return None
+    if report_key(conn, report) != row[0]:
+        return None
+    return row[1]
+
+
+def run_due_schedules(conn, now=None, source=None):
+    """Render every enabled schedule whose time has come; returns the files written."""
+    now = now or datetime.now()
+    written = []
+    due = conn.execute('''
+        SELECT id, name, report, cron, next_run FROM report_schedules
+        WHERE enabled = 1 AND next_run <= ?
+        ORDER BY next_run
+    ''', (now.strftime('%Y-%m-%d %H:%M'),)).fetchall()
+    for schedule_id, name, report, cron, due_at in due:
+        # Claim the run first; with several server processes only one wins
+        claimed = conn.execute('''
+            UPDATE report_schedules SET next_run = ?, last_run = ?
+            WHERE id = ? AND next_run = ?
+        ''', (next_run(cron, now).strftime('%Y-%m-%d %H:%M'), now.strftime('%Y-%m-%d %H:%M:%S'),
+              schedule_id, due_at)).rowcount
+        conn.commit()
+        if not claimed:
+            continue
+        try:
+            path = render_report(conn, name, report, now, source=source)
+            conn.execute('UPDATE report_schedules SET last_file = ?, last_error = NULL WHERE id = ?',
+                         (path, schedule_id))
+            written.append(path)
+        except Exception as e:
+            conn.rollback()
+            conn.execute('UPDATE report_schedules SET last_error = ? WHERE id = ?', (str(e), schedule_id))
+            print(f"Scheduled report '{name}' failed: {e}")
+        conn.commit()
+    return written
+
+
+def open_database(db_name):
+    """Open a connection set up for rendering reports."""
+    # Imported here because schema imports this module for ensure_schedule_tables
+    import schema
+
+    conn = sqlprofile.connect(db_name)
+    conn.row_factory = sqlite3.Row
+    schema.ensure_schema(conn)
+    return conn
+
+
+def _loop(db_name):
+    """Run due reports every poll and the retention cycle every hour, forever.
+
+    Failures are printed and retried on the next pass; an exception escaping
+    here would silently stop reports, retention and period closing for good.
+    """
+    last_retention = 0.0
+    while True:
+        if time.monotonic() - last_retention >= RETENTION_INTERVAL_SECONDS:
+            last_retention = time.monotonic()
+            try:
+                retention.run_retention_cycle(db_name, RETENTION_INTERVAL_SECONDS)
+            except Exception as e:
+                print(f"Retention cycle failed: {type(e).__name__}: {e}")
+        try:
+            conn = open_database(db_name)
+            # Refreshing at half the staleness bound keeps export requests from waiting on a copy
+            source = replica.connect(db_name, replica.MAX_AGE_SECONDS / 2)
+            try:
+                run_due_schedules(conn, source=source)
+                compliance.close_periods(conn)
+            finally:
+                source.close()
+                conn.close()
+        except Exception as e:
+            print(f"Report scheduler failed: {type(e).__name__}: {e}")
+        time.sleep(POLL_SECONDS)
+
+
+def start(db_name):
+    """Start the background scheduler thread once per process."""
+    global _thread
+    if _thread is not None:
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, args=(db_name,), name='scheduler', daemon=True)
+            _thread.start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage scheduled report pre-generation.')
+    parser.add_argument('--db', default='AECD.db')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='show the schedules')
+    add = commands.add_parser('add', help='add or replace a schedule')
+    add.add_argument('name')
+    add.add_argument('report', choices=sorted(REPORTS))
+    add.add_argument('cron', help="e.g. '0 4 * * *' for 04:00 every day")
+    remove = commands.add_parser('remove', help='delete a schedule')
+    remove.add_argument('name')
+    run = commands.add_parser('run', help='render a schedule now')
+    run.add_argument('name')
+    args = parser.parse_args()
+
+    conn = open_database(args.db)
+    if args.command == 'list':
+        rows = conn.execute('SELECT name, report, cron, enabled, next_run, last_run, last_error FROM report_schedules ORDER BY name').fetchall()
+        if not rows:
+            print("No schedules.")
+        for row in rows:
+            status = 'enabled' if row['enabled'] else 'disabled'
+            print(f"{row['name']}: {row['report']} at '{row['cron']}' ({status}), next {row['next_run']}, "
+                  f"last {row['last_run'] or 'never'}" + (f", error: {row['last_error']}" if row['last_error'] else ''))
+    elif args.command == 'add':
+        add_schedule(conn, args.name, args.report, args.cron)
+        print(f"Schedule '{args.name}' saved.")
+    elif args.command == 'remove':
+        removed = conn.execute('DELETE FROM report_schedules WHERE name = ?', (args.name,)).rowcount
+        conn.commit()
+        print(f"Schedule '{args.name}' removed." if removed else f"Schedule '{args.name}' not found.")
+    else:
+        row = conn.execute('SELECT report FROM report_schedules WHERE name = ?', (args.name,)).fetchone()
+        if not row:
+            print(f"Schedule '{args.name}' not found.")
+        else:
+            print(f"Rendered {render_report(conn, args.name, row['report'])}")
+    conn.close()
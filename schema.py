@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import hashlib
+import sqlite3
+import threading
+
+import changefeed
+import compliance
+import descriptors
+import inventory
+import mixrate
+import refcache
+import reports
+import retention
+import scheduler
+import textstore
+
+
+def create_core_tables(conn):
+    """Create the chemicals, trucks, tanks and usage log tables."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chemicals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            mix_rate TEXT,
+            warnings TEXT,
+            description TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS trucks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            truck_name TEXT NOT NULL UNIQUE,
+            license_plate TEXT,
+            description TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tanks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tank_name TEXT NOT NULL UNIQUE,
+            capacity INTEGER,
+            location TEXT,
+            truck_id INTEGER,
+            FOREIGN KEY (truck_id) REFERENCES trucks (id)
+        )
+    ''')
+    # Add truck_id column if it doesn't exist (for databases from before trucks)
+    with contextlib.suppress(sqlite3.OperationalError):
+        cursor.execute('ALTER TABLE tanks ADD COLUMN truck_id INTEGER')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS usage_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chemical_name TEXT NOT NULL,
+            tank_name TEXT NOT NULL,
+            amount_used REAL NOT NULL,
+            date_logged TEXT NOT NULL,
+            notes TEXT
+        )
+    ''')
+    conn.commit()
+
+
+# Every step that creates or upgrades part of the schema, in the order they run.
+# Each must be safe to run again on an up-to-date database; add new ones at the end.
+UPGRADES = (
+    create_core_tables,
+    mixrate.ensure_mix_rate_columns,
+    descriptors.ensure_descriptor_tables,
+    textstore.ensure_text_store,
+    retention.ensure_retention_tables,
+    inventory.ensure_inventory_tables,
+    changefeed.ensure_change_log,
+    scheduler.ensure_schedule_tables,
+    reports.ensure_report_indexes,
+    refcache.ensure_reference_versions,
+    compliance.ensure_compliance_tables,
+)
+
+# Object types compared by a digest of their SQL rather than by name alone
+DEFINED_TYPES = ('index', 'trigger', 'view')
+
+_expected = None
+_expected_lock = threading.Lock()
+
+
+def _definition(sql):
+    """Short digest of an index, trigger or view definition, ignoring whitespace."""
+    return hashlib.sha256(' '.join(sql.split()).encode('utf-8')).hexdigest()[:12]
+
+
+def schema_objects(conn):
+    """Describe a database's tables, columns, indexes, triggers and views as comparable tuples.
+
+    Indexes, triggers and views carry a digest of their SQL, so a changed
+    definition counts as a different object. Tables are described by their
+    columns instead, as the SQL SQLite keeps for them depends on how they
+    were migrated.
+    """
+    objects = set()
+    for object_type, name, sql in conn.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('table', 'index', 'trigger', 'view') AND name NOT LIKE 'sqlite^_%' ESCAPE '^'
+    ''').fetchall():
+        if object_type in DEFINED_TYPES:
+            objects.add((object_type, name, _definition(sql or '')))
+        else:
+            objects.add((object_type, name))
+            objects.update(('column', name, row[1]) for row in conn.execute(f"PRAGMA table_info('{name}')"))
+    return objects
+
+
+def fingerprint(objects):
+    """Hash a set of schema objects into a positive 32-bit value for PRAGMA user_version."""
+    digest = hashlib.sha256('\n'.join(sorted('\t'.join(item) for item in objects)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') & 0x7fffffff or 1
+
+
+def expected_schema():
+    """Return (objects, fingerprint) of the current schema, built once per process in memory."""
+    global _expected
+    if _expected is None:
+        with _expected_lock:
+            if _expected is None:
+                conn = sqlite3.connect(':memory:')
+                for upgrade_step in UPGRADES:
+                    upgrade_step(conn)
+                objects = schema_objects(conn)
+                conn.close()
+                _expected = (objects, fingerprint(objects))
+    return _expected
+
+
+def upgrade(conn):
+    """Run every upgrade step, then stamp the fingerprint if nothing is missing.
+
+    Returns the expected objects still missing afterwards (schema drift the
+    steps could not repair); the database is only stamped when there are none.
+    Extra tables, columns or indexes of its own are left alone.
+    """
+    objects, expected_fingerprint = expected_schema()
+    # Drop indexes, triggers and views whose definition changed; the steps create them anew
+    current = schema_objects(conn)
+    defined = {item[:2] for item in current if item[0] in DEFINED_TYPES}
+    for item in sorted(objects - current):
+        if item[:2] in defined:
+            conn.execute(f'DROP {item[0].upper()} "{item[1]}"')
+    conn.commit()
+    for upgrade_step in UPGRADES:
+        upgrade_step(conn)
+    missing = sorted(objects - schema_objects(conn))
+    if not missing:
+        conn.execute(f'PRAGMA user_version = {expected_fingerprint}')
+        conn.commit()
+    return missing
+
+
+def ensure_schema(conn):
+    """Bring a database up to the current schema and into WAL mode; a current one costs two PRAGMAs."""
+    if conn.execute('PRAGMA user_version').fetchone()[0] != expected_schema()[1]:
+        missing = upgrade(conn)
+        if missing:
+            print(f"Schema drift that could not be repaired: {', '.join(':'.join(item) for item in missing)}")
+    # Per-connection setup the upgrade steps would otherwise have done
+    textstore.register(conn)
+    # Readers, the replica backup among them, never block writers in WAL mode. The mode is kept
+    # in the file, so this switches each database once; if it is busy, the next open retries.
+    with contextlib.suppress(sqlite3.OperationalError):
+        conn.execute('PRAGMA journal_mode=WAL')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check a database against the current schema and upgrade it in place.')
+    parser.add_argument('db_name', nargs='?', default='AECD.db')
+    parser.add_argument('--check', action='store_true', help='only report drift, do not upgrade')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_name)
+    objects, expected_fingerprint = expected_schema()
+    stamped = conn.execute('PRAGMA user_version').fetchone()[0]
+    missing = sorted(objects - schema_objects(conn))
+    print(f"Fingerprint: stored {stamped}, current {expected_fingerprint}"
+          f"{' (up to date)' if stamped == expected_fingerprint else ''}")
+    for item in missing:
+        print(f"Missing {' '.join(item)}")
+    if not args.check and (missing or stamped != expected_fingerprint):
+        missing = upgrade(conn)
+        print("Upgraded; " + (f"{len(missing)} object(s) could not be created." if missing else "schema is current."))
+    elif not missing:
+        print("No drift.")
+    conn.close()
@@ -0,0 +1,53 @@
+import argparse
+import os
+
+import workers
+from app import app, get_db_connection
+
+# Bounded pool of threads running Flask views (and so all database access)
+DB_THREADS = int(os.environ.get('NUTTALLX_DB_THREADS', '16'))
+EXPORT_PROCESSES = int(os.environ.get('NUTTALLX_EXPORT_PROCESSES', str(max(1, (os.cpu_count() or 2) // 2))))
+
+
+def prepare_database():
+    """Upgrade the database and switch it to WAL before the server processes start."""
+    get_db_connection().close()
+
+
+def create_asgi_app():
+    """Wrap the Flask app for an asyncio server, running views on a bounded thread pool."""
+    from a2wsgi import WSGIMiddleware
+    workers.EXPORT_PROCESSES = EXPORT_PROCESSES
+    return WSGIMiddleware(app, workers=DB_THREADS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run NUTtall X with the production server.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '3000')))
+    parser.add_argument('--workers', type=int, default=1, help='server processes')
+    parser.add_argument('--threads', type=int, default=DB_THREADS, help='view threads per process')
+    parser.add_argument('--export-processes', type=int, default=EXPORT_PROCESSES,
+                        help='PDF building processes per server process')
+    args = parser.parse_args()
+
+    try:
+        import a2wsgi  # noqa: F401
+        import uvicorn
+    except ImportError:
+        print("Production mode needs uvicorn and a2wsgi: poetry install --extras serve")
+        return
+
+    # Server processes re-import this module, so pass the settings through the environment
+    os.environ['NUTTALLX_DB_THREADS'] = str(args.threads)
+    os.environ['NUTTALLX_EXPORT_PROCESSES'] = str(args.export_processes)
+    prepare_database()
+
+    print(f"Serving on {args.host}:{args.port} with {args.workers} process(es), "
+          f"{args.threads} view thread(s) and {args.export_processes} export process(es) each...")
+    uvicorn.run('serve:create_asgi_app', factory=True, host=args.host, port=args.port,
+                workers=args.workers, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+# Profiling is on while this file exists; it is re-read by running processes, no restart needed
+CONTROL_FILE = os.environ.get('NUTTALLX_PROFILE_CONTROL', 'sqlprofile.json')
+DEFAULT_LOG = 'slow_queries.ndjson'
+POLL_SECONDS = 2.0
+PROGRESS_STEPS = 1000
+# Query helpers skipped when naming a statement's caller, so the log shows the code that asked
+HELPER_FILES = {'sqlprofile.py', 'rowstream.py', 'refcache.py', 'textstore.py', 'schema.py'}
+
+_settings = None
+_settings_mtime = None
+_checked_at = 0.0
+_settings_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def current_settings():
+    """Return the active profiling settings, or None when profiling is off."""
+    global _settings, _settings_mtime, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < POLL_SECONDS:
+        return _settings
+    with _settings_lock:
+        if now - _checked_at < POLL_SECONDS:
+            return _settings
+        try:
+            mtime = os.stat(CONTROL_FILE).st_mtime
+        except OSError:
+            _settings, _settings_mtime = None, None
+        else:
+            if mtime != _settings_mtime:
+                try:
+                    with open(CONTROL_FILE, encoding='utf-8') as file:
+                        settings = json.load(file)
+                    _settings = {
+                        'threshold_ms': float(settings.get('threshold_ms', 100)),
+                        'sample': min(1.0, max(0.0, float(settings.get('sample', 1.0)))),
+                        'log': settings.get('log') or DEFAULT_LOG,
+                    }
+                except (OSError, ValueError) as e:
+                    print(f"Ignoring profiling control file '{CONTROL_FILE}': {e}")
+                    _settings = None
+                _settings_mtime = mtime
+        _checked_at = now
+        return _settings
+
+
+def _caller():
+    """Describe the first stack frame outside this module and the query helpers."""
+    frame = sys._getframe(2)
+    while frame is not None and os.path.basename(frame.f_code.co_filename) in HELPER_FILES:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+
+
+class QueryStats:
+    """Timing and counters for one statement, collected until its rows are consumed."""
+
+    __slots__ = ('sql', 'caller', 'seconds', 'rows', 'vm_steps', 'statements')
+
+    def __init__(self, sql, caller):
+        self.sql = sql
+        self.caller = caller
+        self.seconds = 0.0
+        self.rows = 0
+        self.vm_steps = 0
+        self.statements = 0
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that times execute and fetch calls and counts the rows they return."""
+
+    _stats = None
+
+    def _run(self, stats, method, *args):
+        """Call a Cursor method with the connection's callbacks attributing work to stats."""
+        conn = self.connection
+        # SQL functions such as text_value() can run nested statements on the same connection
+        outer, conn._active = conn._active, stats
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            stats.seconds += time.perf_counter() - started
+            conn._active = outer
+
+    def _finish(self):
+        """Emit the statement that was being read, if any."""
+        stats, self._stats = self._stats, None
+        if stats is not None:
+            self.connection._record(stats)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        stats = QueryStats(sql, _caller())
+        result = self._run(stats, sqlite3.Cursor.execute, sql, parameters)
+        if self.description is None:
+            stats.rows = max(self.rowcount, 0)
+            self.connection._record(stats)
+        else:
+            # Most of a query's work happens while its rows are fetched
+            self._stats = stats
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        stats = QueryStats(sql, _caller())
+        result = self._run(stats, sqlite3.Cursor.executemany, sql, seq_of_parameters)
+        stats.rows = max(self.rowcount, 0)
+        self.connection._record(stats)
+        return result
+
+    def fetchone(self):
+        if self._stats is None:
+            return super().fetchone()
+        row = self._run(self._stats, sqlite3.Cursor.fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        if self._stats is None:
+            return super().fetchmany(size or self.arraysize)
+        rows = self._run(self._stats, sqlite3.Cursor.fetchmany, size or self.arraysize)
+        self._stats.rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        if self._stats is None:
+            return super().fetchall()
+        rows = self._run(self._stats, sqlite3.Cursor.fetchall)
+        self._stats.rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        if self._stats is None:
+            return super().__next__()
+        try:
+            row = self._run(self._stats, sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._stats.rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Statements whose rows were only partly read are reported when the cursor goes away
+        self._finish()
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose statements are timed and written to the slow-query log."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._active = None
+        self._settings = current_settings() or {'threshold_ms': 100.0, 'sample': 1.0, 'log': DEFAULT_LOG}
+        self._database = os.path.basename(str(args[0] if args else kwargs.get('database', '')))
+        # Trigger bodies and implicit BEGINs show up in the trace; the progress handler counts VM work
+        self.set_trace_callback(self._trace)
+        self.set_progress_handler(self._progress, PROGRESS_STEPS)
+
+    def _trace(self, _statement):
+        if self._active is not None:
+            self._active.statements += 1
+
+    def _progress(self):
+        if self._active is not None:
+            self._active.vm_steps += PROGRESS_STEPS
+        return 0
+
+    def _record(self, stats):
+        """Append a finished statement to the slow-query log if it is slow and sampled."""
+        settings = self._settings
+        duration_ms = stats.seconds * 1000
+        if duration_ms < settings['threshold_ms'] or random.random() >= settings['sample']:
+            return
+        entry = {
+            'ts': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'db': self._database,
+            'sql': ' '.join(stats.sql.split()),
+            'duration_ms': round(duration_ms, 3),
+            'rows': stats.rows,
+            'vm_steps': stats.vm_steps,
+            'statements': stats.statements,
+            'caller': stats.caller,
+            # Lets the summary estimate totals from a sampled log
+            'weight': 1 / settings['sample'],
+        }
+        with _log_lock, open(settings['log'], 'a', encoding='utf-8') as file:
+            file.write(json.dumps(entry) + '\n')
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        stats = QueryStats('COMMIT', _caller())
+        self._active = stats
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            stats.seconds = time.perf_counter() - started
+            self._active = None
+        self._record(stats)
+
+
+def connect(database, **kwargs):
+    """Open a connection, profiled when the control file turns profiling on."""
+    if current_settings() is None:
+        return sqlite3.connect(database, **kwargs)
+    return sqlite3.connect(database, factory=ProfiledConnection, **kwargs)
+
+
+def normalize_sql(sql):
+    """Collapse literals and IN lists so the same query shape groups together."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', sql)
+
+
+def summarize(log_path, limit=20, order='total'):
+    """Group the slow-query log by query shape and return the top entries."""
+    groups = defaultdict(lambda: {'total_ms': 0.0, 'calls': 0.0, 'max_ms': 0.0, 'rows': 0.0, 'callers': Counter()})
+    with open(log_path, encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            weight = entry.get('weight', 1.0)
+            group = groups[normalize_sql(entry['sql'])]
+            group['total_ms'] += entry['duration_ms'] * weight
+            group['calls'] += weight
+            group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+            group['rows'] += entry['rows'] * weight
+            group['callers'][entry['caller']] += 1
+
+    keys = {
+        'total': lambda item: item[1]['total_ms'],
+        'mean': lambda item: item[1]['total_ms'] / item[1]['calls'],
+        'calls': lambda item: item[1]['calls'],
+        'max': lambda item: item[1]['max_ms'],
+    }
+    return sorted(groups.items(), key=keys[order], reverse=True)[:limit]
+
+
+def _print_summary(log_path, limit, order):
+    """Print the top queries as a plain-text table."""
+    if not os.path.exists(log_path):
+        print(f"No slow-query log at '{log_path}'.")
+        return
+    top = summarize(log_path, limit, order)
+    print(f"{'total ms':>10} {'calls':>8} {'mean ms':>9} {'max ms':>9} {'rows/call':>9}  query / top caller")
+    for sql, group in top:
+        calls = group['calls']
+        print(f"{group['total_ms']:>10.1f} {calls:>8.0f} {group['total_ms'] / calls:>9.2f} "
+              f"{group['max_ms']:>9.2f} {group['rows'] / calls:>9.1f}  {sql[:100]}")
+        print(f"{'':>50}  {group['callers'].most_common(1)[0][0]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Turn SQL profiling on or off and summarize the slow-query log.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    on = commands.add_parser('on', help='start profiling in every running process')
+    on.add_argument('--threshold-ms', type=float, default=100.0, help='log statements at least this slow (0 logs all)')
+    on.add_argument('--sample', type=float, default=1.0, help='fraction of slow statements to log')
+    on.add_argument('--log', default=DEFAULT_LOG)
+
+    commands.add_parser('off', help='stop profiling')
+    commands.add_parser('status', help='show whether profiling is on')
+
+    top = commands.add_parser('top', help='summarize the top queries in the slow-query log')
+    top.add_argument('--log', default=None, help=f'log file (default: the active one or {DEFAULT_LOG})')
+    top.add_argument('--limit', type=int, default=20)
+    top.add_argument('--by', choices=['total', 'mean', 'calls', 'max'], default='total')
+    args = parser.parse_args()
+
+    if args.command == 'on':
+        if not 0 < args.sample <= 1:
+            parser.error('--sample must be in (0, 1]')
+        with open(CONTROL_FILE, 'w', encoding='utf-8') as file:
+            json.dump({'threshold_ms': args.threshold_ms, 'sample': args.sample,
+                       'log': os.path.abspath(args.log)}, file)
+        print(f"Profiling on: statements over {args.threshold_ms:g} ms, sampled at {args.sample:g}, "
+              f"logged to {os.path.abspath(args.log)}")
+    elif args.command == 'off':
+        if os.path.exists(CONTROL_FILE):
+            os.remove(CONTROL_FILE)
+        print("Profiling off.")
+    elif args.command == 'status':
+        settings = current_settings()
+        print(f"Profiling on: {settings}" if settings else "Profiling off.")
+    else:
+        settings = current_settings()
+        _print_summary(args.log or (settings or {}).get('log') or DEFAULT_LOG, args.limit, args.by)
@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+
+# Free-text columns kept in the interned store; each gets a <column>_id reference
+INTERNED_COLUMNS = {
+    'chemicals': ('warnings', 'description'),
+    'usage_log': ('notes',),
+}
+
+COMPRESS_MIN_BYTES = 200
+CACHE_SIZE = 4096
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _digest(text):
+    """Hash a value for the deduplication lookup."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+def ensure_text_store(conn):
+    """Create the text store, add the reference columns and move existing text into it."""
+    cursor = conn.cursor()
+    # AUTOINCREMENT so a pruned id is never handed out again while other processes cache it
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS text_store (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            digest BLOB NOT NULL UNIQUE,
+            compressed INTEGER NOT NULL DEFAULT 0,
+            value BLOB NOT NULL
+        )
+    ''')
+    conn.commit()
+    register(conn)
+
+    for table, columns in INTERNED_COLUMNS.items():
+        for column in columns:
+            try:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column}_id INTEGER REFERENCES text_store (id)')
+            except sqlite3.OperationalError:
+                # Column already exists, ignore the error
+                continue
+            _migrate_column(conn, table, column)
+    conn.commit()
+
+
+def _migrate_column(conn, table, column):
+    """Intern a column's existing values and clear the inline copies."""
+    rows = conn.execute(f'SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL').fetchall()
+    conn.executemany(f'UPDATE {table} SET {column}_id = ?, {column} = NULL WHERE id = ?',
+                     [(intern(conn, row[1]), row[0]) for row in rows])
+
+
+def intern(conn, text):
+    """Return the id of a string in the text store, adding it if it is new."""
+    if text is None:
+        return None
+    text = str(text)
+    value, compressed = text, 0
+    if len(text) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(text.encode('utf-8'), 6)
+        if len(packed) < len(text.encode('utf-8')):
+            value, compressed = packed, 1
+
+    # New strings take one statement; known ones fall through to the digest lookup
+    digest = _digest(text)
+    cursor = conn.execute('INSERT OR IGNORE INTO text_store (digest, compressed, value) VALUES (?, ?, ?)',
+                          (digest, compressed, value))
+    if cursor.rowcount:
+        return cursor.lastrowid
+    return conn.execute('SELECT id FROM text_store WHERE digest = ?', (digest,)).fetchone()[0]
+
+
+def lookup(conn, text_id, db_key=None):
+    """Return the string for a text store id, served from the shared LRU when possible."""
+    if text_id is None:
+        return None
+    key = (db_key, text_id)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    row = conn.execute('SELECT compressed, value FROM text_store WHERE id = ?', (text_id,)).fetchone()
+    if row is None:
+        return None
+    text = zlib.decompress(row[1]).decode('utf-8') if row[0] else row[1]
+
+    # Entries never change once written, so cached values only need evicting for space
+    with _cache_lock:
+        _cache[key] = text
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return text
+
+
+def register(conn):
+    """Make text_value(id) available in SQL on this connection."""
+    db_key = conn.execute('PRAGMA database_list').fetchone()[2] or id(conn)
+    conn.create_function('text_value', 1, lambda text_id: lookup(conn, text_id, db_key), deterministic=True)
+
+
+def decoded(column, alias=''):
+    """SQL expression reading an interned column, falling back to text written inline.
+
+    Calls text_value() for every row, which suits single-row lookups; queries
+    that scan many rows should use text_join() and joined() instead.
+    """
+    prefix = f"{alias}." if alias else ''
+    return f"COALESCE(text_value({prefix}{column}_id), {prefix}{column})"
+
+
+def _store_alias(column, alias):
+    """Name the text_store row joined in for one interned column."""
+    return f"{alias}_{column}_text" if alias else f"{column}_text"
+
+
+def text_join(column, alias=''):
+    """LEFT JOIN of the text store row behind an interned column, for the FROM clause of a scan."""
+    prefix = f"{alias}." if alias else ''
+    store = _store_alias(column, alias)
+    return f"LEFT JOIN text_store {store} ON {store}.id = {prefix}{column}_id"
+
+
+def joined(column, alias=''):
+    """Like decoded(), but reading the text_join() row; only compressed strings go through text_value()."""
+    prefix = f"{alias}." if alias else ''
+    store = _store_alias(column, alias)
+    return (f"COALESCE(CASE WHEN {store}.compressed THEN text_value({store}.id) ELSE {store}.value END, "
+            f"{prefix}{column})")
+
+
+def prune(conn):
+    """Delete stored strings that no column references any more."""
+    references = ' UNION '.join(
+        f"SELECT {column}_id FROM {table} WHERE {column}_id IS NOT NULL"
+        for table, columns in INTERNED_COLUMNS.items() for column in columns
+    )
+    cursor = conn.execute(f'DELETE FROM text_store WHERE id NOT IN ({references})')
+    conn.commit()
+    return cursor.rowcount
+
+
+def stats(conn):
+    """Summarize the store: (strings, stored bytes, references, inline text bytes saved)."""
+    strings, stored = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM text_store').fetchone()
+    references = saved = 0
+    for table, columns in INTERNED_COLUMNS.items():
+        for column in columns:
+            count, length = conn.execute(f'''
+                SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST({joined(column, 'r')} AS BLOB))), 0)
+                FROM {table} r {text_join(column, 'r')}
+                WHERE r.{column}_id IS NOT NULL
+            ''').fetchone()
+            references += count
+            saved += length
+    return strings, stored, references, saved - stored
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move free-text fields into the interned text store.')
+    parser.add_argument('db_name', nargs='?', default='AECD.db')
+    parser.add_argument('--prune', action='store_true', help='delete strings no row references')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_name)
+    ensure_text_store(conn)
+    if args.prune:
+        print(f"Pruned {prune(conn)} unreferenced string(s).")
+    strings, stored, references, saved = stats(conn)
+    print(f"{strings} distinct strings ({stored} bytes) for {references} references; {saved} bytes saved.")
+    conn.close()
@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import rowstream
+
+# Processes for CPU-heavy report building; 0 builds reports in the request thread
+EXPORT_PROCESSES = int(os.environ.get('NUTTALLX_EXPORT_PROCESSES', '0'))
+EXPORT_TIMEOUT_SECONDS = 120
+
+_export_executor = None
+_export_lock = threading.Lock()
+
+
+def export_executor():
+    """Return the shared report-building process pool, creating it on first use."""
+    global _export_executor
+    if _export_executor is None:
+        with _export_lock:
+            if _export_executor is None:
+                # spawn avoids forking a process that is already running server threads
+                _export_executor = ProcessPoolExecutor(max_workers=EXPORT_PROCESSES,
+                                                       mp_context=multiprocessing.get_context('spawn'))
+    return _export_executor
+
+
+def run_export(builder, *args):
+    """Run a report builder in the process pool when one is configured, else inline."""
+    if EXPORT_PROCESSES <= 0:
+        return builder(*args)
+    # Row streams are read here, in the thread that owns their connection; the records pickle compactly
+    args = [list(arg) if isinstance(arg, rowstream.RowStream) else arg for arg in args]
+    return export_executor().submit(builder, *args).result(timeout=EXPORT_TIMEOUT_SECONDS)
+
+
+def shutdown():
+    """Stop the process pool, waiting for running exports."""
+    global _export_executor
+    with _export_lock:
+        if _export_executor is not None:
+            _export_executor.shutdown()
+            _export_executor = None